@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_SIZE = 1024
+CACHE_TTL = 6 * 60 * 60
+
+class TTLCache:
+    """In-memory LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SolutionCache:
+    """
+    Planner results keyed on a canonical form of the request.
+
+    Results live in an in-memory TTLCache, and are also written to cache_dir when it is given so that they survive
+    restarts and can be shared between bot processes.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, cache_dir: str = None):
+        self.memory = TTLCache(maxsize, ttl)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(semester: str, modules: list, blocked_timings: dict, max_hours: int, catalog_version) -> str:
+        """Requests that only differ in module order or empty blocked days share the same key."""
+        canonical = {
+            'semester': str(semester),
+            'modules': sorted(modules),
+            'blocked_timings': {str(day): sorted(timings) for day, timings in blocked_timings.items() if timings},
+            'max_hours': max_hours,
+            'catalog_version': catalog_version,
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, key: str):
+        result = self._get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _get(self, key: str):
+        result = self.memory.get(key)
+        if result is not None or not self.cache_dir:
+            return result
+
+        try:
+            with open(self._path(key), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['created'] + self.ttl < time.time():
+            return None
+
+        result = tuple(entry['result'])
+        self.memory.set(key, result)
+        return result
+
+    def set(self, key: str, result: tuple) -> None:
+        self.memory.set(key, result)
+        if not self.cache_dir:
+            return
+
+        # Write to a temporary file first so that readers never see a partial entry
+        tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'created': time.time(), 'result': list(result)}, f)
+        os.replace(tmp_path, self._path(key))
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if not self.cache_dir:
+            return
+
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.json'):
+                os.remove(os.path.join(self.cache_dir, file_name))
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from utils.schedule import ScheduleData
+from utils.clashes import module_clashes
+
+class ConflictGraph:
+    """
+    Conflicts between the class options of a set of modules.
+
+    Lesson times are fixed, so two options conflict exactly when any of their lessons overlap. A sweep over the lessons
+    of each day yields the maximal cliques of overlapping options, and every conflict lies in one of them.
+    """
+
+    def __init__(self, mod_info: list):
+        self.schedule = schedule = ScheduleData.coerce(mod_info)
+        # option -> (module_idx, class_type, class_no), options are the classes of the schedule
+        self.options = [(module_idx, schedule.type_names[type_idx], class_no) for module_idx, type_idx, class_no
+                        in zip(schedule.class_module.tolist(), schedule.class_type.tolist(), schedule.class_nos)]
+        # lesson -> (option_idx, day, start, end)
+        self.lessons = list(zip(schedule.class_idx.tolist(), schedule.day.tolist(), schedule.start.tolist(), schedule.end.tolist()))
+        self.option_counts = [{} for _ in range(schedule.n_modules)]
+        for module_idx, type_name, count in zip(schedule.type_module.tolist(), schedule.type_names, schedule.option_counts.tolist()):
+            self.option_counts[module_idx][type_name] = count
+        self.cliques = []
+
+        self._sweep()
+
+    def _sweep(self):
+        events_per_day = defaultdict(list)
+        for lesson_idx, (_, day, start, end) in enumerate(self.lessons):
+            # Empty lessons never occupy any time
+            if start < end:
+                # Ends sort before starts at the same time, as back to back lessons do not overlap
+                events_per_day[day].append((start, 1, lesson_idx))
+                events_per_day[day].append((end, 0, lesson_idx))
+
+        seen_cliques = set()
+        for day in sorted(events_per_day):
+            active = {}
+            grew = False
+            for _, is_start, lesson_idx in sorted(events_per_day[day]):
+                if is_start:
+                    active[lesson_idx] = self.lessons[lesson_idx][0]
+                    grew = True
+                else:
+                    # The active set right before the first end after a run of starts is a maximal clique
+                    if grew:
+                        clique = frozenset(active.values())
+                        if len(clique) > 1 and clique not in seen_cliques:
+                            seen_cliques.add(clique)
+                            self.cliques.append(sorted(clique))
+                        grew = False
+                    del active[lesson_idx]
+
+    def clique_options(self) -> list:
+        """Maximal cliques as lists of (module_idx, class_type, class_no)."""
+        return [[self.options[option_idx] for option_idx in clique] for clique in self.cliques]
+
+    def conflicts(self, option: tuple) -> list:
+        """Options that can not be taken together with the given (module_idx, class_type, class_no)."""
+        option_idx = self.options.index(option)
+        neighbours = {other_idx for clique in self.cliques if option_idx in clique for other_idx in clique}
+        neighbours.discard(option_idx)
+        return [self.options[other_idx] for other_idx in sorted(neighbours)]
+
+    def module_clashes(self, single_only: bool = False) -> dict:
+        """
+        Lesson overlaps between pairs of modules in the format of helpers.check_overlaps, keyed on
+        (module_idx1, module_idx2) with module_idx1 < module_idx2. See clash_records for the structured form.
+
+        single_only: only consider lesson types with a single class option, whose clashes can never be avoided
+        """
+        return {pair: [clash.as_overlap() for clash in clashes] for pair, clashes in self.clash_records(single_only).items()}
+
+    def clash_records(self, single_only: bool = False) -> dict:
+        """Lists of utils.clashes.Clash between pairs of modules, keyed on (module_idx1, module_idx2)."""
+        return module_clashes(self.schedule, single_only)
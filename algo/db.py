@@ -2,129 +2,125 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import asyncio
 import logging
-import requests
+import time
+from abc import ABC, abstractmethod
 from utils.keys import MONGO_CONN_STRING
-from utils.helpers import day_to_int, shorten_lesson_type, check_block_timings
-from pymongo import MongoClient
+from utils.helpers import day_to_int, class_signature, normalize_semester_data
+from pymongo import MongoClient, ReturnDocument, ReplaceOne, DeleteMany
+from collections import defaultdict
+from algo.cache import TTLCache
+from utils.schedule import ScheduleData, BlockedTimes
+from utils.clashes import module_clashes
+from algo.ingest import CatalogIngestor, SCHEMA_VERSION
 from pprint import pprint
 import json
 import pdb
 
-class DBClient:
+CATALOG_CACHE_SIZE = 4096
+CATALOG_CACHE_TTL = 60 * 60
+# Seconds between reads of the catalog version stamp
+VERSION_CHECK_INTERVAL = 30.0
+
+_MISSING = object()
+
+class CatalogClient(ABC):
+    """
+    Read side of the module catalog, which is all the bot needs.
+
+    Subclasses say where the catalog comes from. Writing it is left to DBClient, the only client backed by Mongo.
+    """
+
     def __init__(self):
         logging.basicConfig(
             format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
         )
         self.logger = logging.getLogger(self.__class__.__name__)
-        acad_year = '2024-2025'
-        self.base_url = f'https://api.nusmods.com/v2/{acad_year}/%s.json'
-        self.mongo_client = MongoClient(f'{MONGO_CONN_STRING}')
-        self.db = self.mongo_client.nusmods
-        self.collection = self.db.module_info 
+        self.refresh_callbacks = []
+        # (mod_id, semester) -> semester data, or None when the module is not offered that semester
+        self.catalog_cache = TTLCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+    @abstractmethod
+    def get_catalog_version(self) -> int:
+        """Version of the module catalog, bumped on every refresh so that downstream caches can key on it."""
+
+    @abstractmethod
+    def _load_semester_data(self, mod_ids: list, semester: str) -> dict:
+        """Semester data of each module, with modules that are not offered in the semester mapped to None."""
+
+    @abstractmethod
+    def _load_normalized_data(self, mod_ids: list, semester: str) -> dict:
+        """Normalized semester data of each module, with modules that are not offered in the semester mapped to None."""
+
+    @abstractmethod
+    def get_module_clashes(self, mod_id: str, modules: list, semester: str) -> dict:
+        """
+        Irreconcilable clashes between mod_id and each of modules, as {other mod_id: [[mod_id lesson, other lesson]]}
+        with lessons described as in check_overlaps.
+        """
 
     def check_valid_mod(self, mod_id: str, semester: str) -> bool:
-        resp = self.collection.find_one({'mod_id': mod_id, f'semester_data.{semester}': {'$exists': True}})
-        if resp:
-            return True
-        else:
-            return False
-    
-    def get_mod_info(self, mod_id: str, semester: str) -> dict:
-        # No need error handling for resp as check_valid_mod is called before this
-        resp = self.collection.find_one({'mod_id': mod_id})
-        mod_info = resp['semester_data'][semester]
-        return mod_info
+        # Also warms the cache for the module info that is drawn once the user is done
+        return self._load_normalized_data([mod_id], semester)[mod_id] is not None
 
-    def _get_modules(self) -> list:
-        url = self.base_url % 'moduleList'
-        data = requests.get(url=url).json()       
-        module_list = [mod['moduleCode'] for mod in data]
-        return module_list
-
-    def _get_module_info(self, module_code: str) -> dict:
-        url = self.base_url % f'modules/{module_code}'
-        # handle api resp
-        data = requests.get(url=url).json()
-        module_info = {
-            'mod_id': module_code,
-            'mod_name': data['title'],
-            'semester_data': {}
-        }
-        for sem_data in data['semesterData']:
-            semester = str(sem_data['semester'])
-            module_info['semester_data'][semester] = {}
-            for timetable in sem_data['timetable']:
-                # lesson_data -> dict
-                lesson_type = shorten_lesson_type(timetable['lessonType'])
-                class_no = timetable['classNo']
-
-                lesson_data = module_info['semester_data'][semester].get(lesson_type, {})
-                module_info['semester_data'][semester][lesson_type] = lesson_data
-
-                class_data = lesson_data.get(class_no, [])
-                class_data.append({
-                    'class_no': timetable['classNo'],
-                    'day': day_to_int(timetable['day']),
-                    'start_time': timetable['startTime'],
-                    'end_time': timetable['endTime'],
-                })
-                module_info['semester_data'][semester][lesson_type][class_no] = class_data
-    
-        return module_info
+    def on_refresh(self, callback) -> None:
+        """Registers a callback that is run after this client loads new module data."""
+        self.refresh_callbacks.append(callback)
 
-    def insert_module_info(self) -> None:
-        # transaction should be atomic
-        mod_id_list = self._get_modules()
-        insert_list = []
-        for mod_id in mod_id_list:
-            module_info = self._get_module_info(mod_id)
-            self.logger.info(f'Retrieved module info for {mod_id}')
-            insert_list.append(module_info)
-        
-        result = self.collection.insert_many(insert_list).inserted_ids
-        self.logger.info(f'{len(result)} rows inserted')
-    
-    def refresh_module_info(self) -> None:
-        resp = self.collection.delete_many({})
-        self.logger.info(f'{resp.deleted_count} rows deleted')
-        self.insert_module_info()
+    def get_mod_info(self, mod_id: str, semester: str) -> dict:
+        # No need error handling for resp as check_valid_mod is called before this
+        return self._load_semester_data([mod_id], semester)[mod_id]
 
     def draw_module_info(self, modules: list, semester: str) -> list:
-        mod_info = []
-        for module in modules:
-            mod_info.append(self.get_mod_info(module, semester))
-        return mod_info
+        semester_data = self._load_semester_data(modules, semester)
+        return [semester_data[module] for module in modules]
+
+    def draw_normalized_info(self, modules: list, semester: str) -> list:
+        """Normalized semester data of the modules, see normalize_semester_data."""
+        normalized_data = self._load_normalized_data(modules, semester)
+        return [normalized_data[module] for module in modules]
 
     def draw_distinct_info(self, modules: list, semester: str) -> list:
-        mod_info = self.draw_module_info(modules, semester)
-
-        def is_identical(class_list1, class_list2):
-            if len(class_list1) != len(class_list2):
-                return False
-            sorted_class_list1 = sorted(class_list1, key=lambda x: (x['day'], x['start_time'], x['end_time']))
-            sorted_class_list2 = sorted(class_list2, key=lambda x: (x['day'], x['start_time'], x['end_time']))
-            return all(class1['day'] == class2['day'] and
-                    class1['start_time'] == class2['start_time'] and
-                    class1['end_time'] == class2['end_time']
-                    for class1, class2 in zip(sorted_class_list1, sorted_class_list2))
+        return self.distinct_module_info(self.draw_module_info(modules, semester))
+
+    def distinct_module_info(self, mod_info: list, equivalents: list = None) -> list:
+        """
+        Drops classes whose lessons are at exactly the same times as a class that is already kept.
 
+        equivalents: if given, a {class_type: {kept class_no: [interchangeable class_nos]}} dict is appended to it for
+        every module
+        """
         distinct_mod_info = []
         for module in mod_info:
             distinct_module = {}
+            module_equivalents = {}
             for class_type, class_groups in module.items():
                 unique_classes = {}
+                # signature -> class_no of the first class with those lesson times
+                kept_class_nos = {}
+                groups = {}
                 for class_no, class_list in class_groups.items():
-                    if not any(is_identical(class_list, unique_class_list) for unique_class_list in unique_classes.values()):
+                    signature = class_signature(class_list)
+                    kept_class_no = kept_class_nos.get(signature)
+                    if kept_class_no is None:
+                        kept_class_nos[signature] = class_no
                         unique_classes[class_no] = class_list
+                        groups[class_no] = [class_no]
+                    else:
+                        groups[kept_class_no].append(class_no)
                 distinct_module[class_type] = unique_classes
+                module_equivalents[class_type] = {class_no: group for class_no, group in groups.items() if len(group) > 1}
             distinct_mod_info.append(distinct_module)
+            if equivalents is not None:
+                equivalents.append(module_equivalents)
         return distinct_mod_info
 
-
     def draw_filtered_module_info(self, modules: list, semester: str, blocked_days: list, timings: dict) -> list:
-        mod_info = self.draw_distinct_info(modules, semester)
+        return self.filter_module_info(self.draw_distinct_info(modules, semester), blocked_days, timings)
 
+    def filter_module_info(self, mod_info: list, blocked_days: list, timings: dict) -> list:
+        """Drops classes on blocked days or timings, with timings keyed on day names as chosen in the bot."""
         blocked_timings = {}
         for key in timings:
             if timings[key]:
@@ -133,29 +129,13 @@ class DBClient:
         unique_mod_info = self.module_days_filtered(mod_info, blocked_days, blocked_timings)
         #print(unique_mod_info)
         return unique_mod_info
-    
+
     def module_days_filtered(self, mod_info: list, blocked_days: list, blocked_timings: dict) -> list:
         if blocked_days or blocked_timings:
-            filtered_mod_info = []
-            for mod in mod_info:
-                filtered_info = {}
-                for lesson_type, class_info in mod.items():
-                    filtered_classes = {}
-
-                    for lesson_no, lesson_info in class_info.items():
-                        is_blocked = False
-                        for item in lesson_info:
-                            if item['day'] in blocked_days or check_block_timings(item, blocked_timings):
-                                is_blocked = True
-                                break
-                        if not is_blocked:
-                            filtered_classes[lesson_no] = lesson_info
-
-                    filtered_info[lesson_type] = filtered_classes
-
-                filtered_mod_info.append(filtered_info)
-
-            return filtered_mod_info
+            blocked_times = BlockedTimes(blocked_days, blocked_timings)
+            if isinstance(mod_info, ScheduleData):
+                return blocked_times.filter(mod_info)
+            return blocked_times.filter(ScheduleData.from_mod_info(mod_info)).to_mod_info()
         
         return mod_info
 
@@ -170,5 +150,165 @@ class DBClient:
             json.dump(mod_info, f)
         self.logger.info(f'Testcase for {semester} {len(modules)} modules created')
 
+class DBClient(CatalogClient):
+    """Catalog client backed by Mongo, which also ingests and refreshes the catalog."""
+
+    def __init__(self):
+        super().__init__()
+        acad_year = '2024-2025'
+        self.base_url = f'https://api.nusmods.com/v2/{acad_year}/%s.json'
+        self.mongo_client = MongoClient(f'{MONGO_CONN_STRING}')
+        self.db = self.mongo_client.nusmods
+        self.collection = self.db.module_info 
+        self.meta_collection = self.db.catalog_meta
+        self.clash_collection = self.db.module_clashes
+        self.cached_version = None
+        self.version_checked_at = 0.0
+
+    def _sync_catalog_cache(self) -> None:
+        """Drops every cached catalog read once the catalog version stamp changes."""
+        now = time.monotonic()
+        if self.cached_version is not None and now - self.version_checked_at < VERSION_CHECK_INTERVAL:
+            return
+        version = self.get_catalog_version()
+        if version != self.cached_version:
+            self.catalog_cache.clear()
+            self.cached_version = version
+        self.version_checked_at = now
+
+    def _load_semester_data(self, mod_ids: list, semester: str) -> dict:
+        """
+        Semester data of each module, taken from the catalog cache with a single batched query for the rest.
+        Modules that are not offered in the semester map to None.
+        """
+        self._sync_catalog_cache()
+        semester_data = {}
+        missing = []
+        for mod_id in mod_ids:
+            cached = self.catalog_cache.get((mod_id, semester), _MISSING)
+            if cached is _MISSING:
+                missing.append(mod_id)
+            else:
+                semester_data[mod_id] = cached
+
+        if missing:
+            projection = {'_id': 0, 'mod_id': 1, f'semester_data.{semester}': 1}
+            for resp in self.collection.find({'mod_id': {'$in': missing}}, projection):
+                semester_data[resp['mod_id']] = resp.get('semester_data', {}).get(semester)
+            for mod_id in missing:
+                semester_data.setdefault(mod_id, None)
+                self.catalog_cache.set((mod_id, semester), semester_data[mod_id])
+        return semester_data
+
+    def _load_normalized_data(self, mod_ids: list, semester: str) -> dict:
+        """
+        Normalized semester data of each module, as stored at ingestion. Documents from before the current SCHEMA_VERSION
+        are normalized on the fly from their raw semester data. Modules that are not offered in the semester map to None.
+        """
+        self._sync_catalog_cache()
+        normalized_data = {}
+        missing = []
+        for mod_id in mod_ids:
+            cached = self.catalog_cache.get(('normalized', mod_id, semester), _MISSING)
+            if cached is _MISSING:
+                missing.append(mod_id)
+            else:
+                normalized_data[mod_id] = cached
+
+        if missing:
+            outdated = []
+            projection = {'_id': 0, 'mod_id': 1, 'schema_version': 1, f'normalized_data.{semester}': 1}
+            for resp in self.collection.find({'mod_id': {'$in': missing}}, projection):
+                if resp.get('schema_version', 1) < SCHEMA_VERSION:
+                    outdated.append(resp['mod_id'])
+                else:
+                    normalized_data[resp['mod_id']] = resp.get('normalized_data', {}).get(semester)
+            if outdated:
+                semester_data = self._load_semester_data(outdated, semester)
+                for mod_id in outdated:
+                    if semester_data[mod_id] is not None:
+                        normalized_data[mod_id] = normalize_semester_data(semester_data[mod_id])
+            for mod_id in missing:
+                normalized_data.setdefault(mod_id, None)
+                self.catalog_cache.set(('normalized', mod_id, semester), normalized_data[mod_id])
+        return normalized_data
+
+    def get_catalog_version(self) -> int:
+        resp = self.meta_collection.find_one({'_id': 'module_info'})
+        if resp:
+            return resp['version']
+        return 0
+
+    def insert_module_info(self) -> None:
+        stats = asyncio.run(CatalogIngestor(self.base_url, self.collection).run())
+        self.logger.info(f'{stats.written} rows upserted')
+        self.rebuild_clash_index()
+
+    def refresh_module_info(self) -> None:
+        """
+        Brings the catalog up to date while it stays readable. Only modules whose content hash changed are rewritten,
+        modules that left the catalog are deleted, and a new catalog version is published once every write is done.
+        """
+        known_hashes = {resp['mod_id']: resp.get('content_hash') for resp in self.collection.find({}, {'_id': 0, 'mod_id': 1, 'content_hash': 1})}
+        stats = asyncio.run(CatalogIngestor(self.base_url, self.collection, known_hashes=known_hashes).run())
+
+        # Modules that failed to fetch are kept, only those missing from the module list are removed
+        removed = sorted(set(known_hashes) - set(stats.module_codes))
+        if removed:
+            self.collection.delete_many({'mod_id': {'$in': removed}})
+        self.logger.info(f'{stats.written} rows updated, {stats.unchanged} unchanged, {len(removed)} deleted')
+        if not stats.written and not removed:
+            return
+
+        self.rebuild_clash_index()
+        resp = self.meta_collection.find_one_and_update({'_id': 'module_info'}, {'$inc': {'version': 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        self.logger.info(f'Catalog version {resp["version"]} published')
+        self.catalog_cache.clear()
+        self.cached_version = None
+        for callback in self.refresh_callbacks:
+            callback()
+
+    def rebuild_clash_index(self) -> None:
+        """
+        Recomputes the module_clashes collection: for every semester and module, the modules it can never be taken
+        together with because lessons of lesson types with a single option clash. Classes with identical times count
+        as one option.
+        """
+        # semester -> {mod_id: deduplicated classes}
+        catalog = defaultdict(dict)
+        projection = {'_id': 0, 'mod_id': 1, 'schema_version': 1, 'normalized_data': 1, 'semester_data': 1}
+        for resp in self.collection.find({}, projection):
+            if resp.get('schema_version', 1) >= SCHEMA_VERSION:
+                normalized_data = resp.get('normalized_data', {})
+            else:
+                normalized_data = {semester: normalize_semester_data(data) for semester, data in resp.get('semester_data', {}).items()}
+            for semester, normalized in normalized_data.items():
+                catalog[semester][resp['mod_id']] = normalized['classes']
+
+        operations = [DeleteMany({'semester': {'$nin': list(catalog)}})]
+        for semester, modules in catalog.items():
+            mod_ids = list(modules)
+            clashes = module_clashes(ScheduleData.from_mod_info(list(modules.values())), single_only=True)
+            entries = defaultdict(list)
+            for (i, j), pair_clashes in clashes.items():
+                overlaps = [clash.as_overlap() for clash in pair_clashes]
+                entries[mod_ids[i]].append({'mod_id': mod_ids[j], 'lessons': [[overlap['module1'], overlap['module2']] for overlap in overlaps]})
+                entries[mod_ids[j]].append({'mod_id': mod_ids[i], 'lessons': [[overlap['module2'], overlap['module1']] for overlap in overlaps]})
+            for mod_id, clashing in entries.items():
+                doc = {'semester': semester, 'mod_id': mod_id, 'clashes': clashing}
+                operations.append(ReplaceOne({'semester': semester, 'mod_id': mod_id}, doc, upsert=True))
+            operations.append(DeleteMany({'semester': semester, 'mod_id': {'$nin': list(entries)}}))
+            self.logger.info(f'{len(clashes)} irreconcilable module pairs in semester {semester}')
+        self.clash_collection.bulk_write(operations, ordered=False)
+
+    def get_module_clashes(self, mod_id: str, modules: list, semester: str) -> dict:
+        self._sync_catalog_cache()
+        entries = self.catalog_cache.get(('clashes', mod_id, semester), _MISSING)
+        if entries is _MISSING:
+            resp = self.clash_collection.find_one({'semester': semester, 'mod_id': mod_id})
+            entries = {entry['mod_id']: entry['lessons'] for entry in resp['clashes']} if resp else {}
+            self.catalog_cache.set(('clashes', mod_id, semester), entries)
+        return {other: entries[other] for other in modules if other in entries}
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,112 @@
+import time
+from collections import defaultdict
+import numpy as np
+from utils.helpers import lesson_bitmask, SLOT_MINUTES
+from utils.schedule import ScheduleData
+
+FAST_PATH_NODE_LIMIT = 20000
+FAST_PATH_TIME_LIMIT = 0.1
+
+class _BudgetExceeded(Exception):
+    pass
+
+class FastPathSolver:
+    """
+    Backtracking search over week bitmasks for the hard constraints of a request.
+
+    Each lesson type of a module is a variable whose values are its class options, and every option is a bitmask of
+    the 5-minute slots its lessons occupy. The search always branches on the lesson type with the fewest options left,
+    and gives up once it runs past its node or time budget so that CP-SAT can take over. Options in hint, which maps
+    (module_idx, class_type) to a class_no, are tried first.
+    """
+
+    FOUND = 'FOUND'
+    INFEASIBLE = 'INFEASIBLE'
+    UNKNOWN = 'UNKNOWN'
+
+    def __init__(self, mod_info: list, max_mins: int, node_limit: int = FAST_PATH_NODE_LIMIT, time_limit: float = FAST_PATH_TIME_LIMIT,
+                 hint: dict = None):
+        self.max_mins = max_mins
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.nodes = 0
+
+        schedule = ScheduleData.coerce(mod_info)
+        # Bitmasks are only exact when every lesson starts and ends on a slot boundary
+        self.exact = not (np.any(schedule.start % SLOT_MINUTES) or np.any(schedule.end % SLOT_MINUTES))
+        lessons_per_day = np.bincount(schedule.day)
+
+        day, start, end = schedule.day.tolist(), schedule.start.tolist(), schedule.end.tolist()
+        class_offsets = schedule.class_offsets.tolist()
+        type_offsets = schedule.type_offsets.tolist()
+        self.variables = []
+        for type_idx, (module_idx, class_type) in enumerate(zip(schedule.type_module.tolist(), schedule.type_names)):
+            options = []
+            for class_idx in range(type_offsets[type_idx], type_offsets[type_idx + 1]):
+                mask = 0
+                minutes = defaultdict(int)
+                for row in range(class_offsets[class_idx], class_offsets[class_idx + 1]):
+                    mask |= lesson_bitmask(day[row], start[row], end[row])
+                    minutes[day[row]] += end[row] - start[row]
+                options.append((schedule.class_nos[class_idx], mask, tuple(minutes.items())))
+            if hint and (module_idx, class_type) in hint:
+                options.sort(key=lambda option: option[0] != hint[(module_idx, class_type)])
+            self.variables.append(((module_idx, class_type), options))
+
+        # Mirrors the CP-SAT model, which only limits the hours of days with more than one lesson
+        self.limited_days = set(np.flatnonzero(lessons_per_day > 1).tolist())
+
+    def _fits(self, day_minutes: dict, minutes: tuple) -> bool:
+        for day, duration in minutes:
+            if day in self.limited_days and day_minutes.get(day, 0) + duration > self.max_mins:
+                return False
+        return True
+
+    def _search(self, occupied: int, day_minutes: dict, unassigned: list, choice: dict) -> bool:
+        self.nodes += 1
+        if self.nodes > self.node_limit or time.perf_counter() > self.deadline:
+            raise _BudgetExceeded()
+        if not unassigned:
+            return True
+
+        # Most constrained lesson type first
+        best_idx, best_candidates = None, None
+        for var_idx in unassigned:
+            candidates = [option for option in self.variables[var_idx][1] if not option[1] & occupied and self._fits(day_minutes, option[2])]
+            if best_candidates is None or len(candidates) < len(best_candidates):
+                best_idx, best_candidates = var_idx, candidates
+                if not candidates:
+                    return False
+
+        key = self.variables[best_idx][0]
+        rest = [var_idx for var_idx in unassigned if var_idx != best_idx]
+        for class_no, mask, minutes in best_candidates:
+            next_minutes = dict(day_minutes)
+            for day, duration in minutes:
+                next_minutes[day] = next_minutes.get(day, 0) + duration
+            choice[key] = class_no
+            if self._search(occupied | mask, next_minutes, rest, choice):
+                return True
+            del choice[key]
+        return False
+
+    def solve(self) -> tuple:
+        """
+        Returns (status, choice) where choice maps (module_idx, class_type) to the selected class_no.
+
+        INFEASIBLE is only reported when the search was exhaustive and exact, otherwise the status is UNKNOWN.
+        """
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_limit
+        choice = {}
+
+        if any(not options for _, options in self.variables):
+            return (self.INFEASIBLE, {})
+        try:
+            found = self._search(0, {}, list(range(len(self.variables))), choice)
+        except _BudgetExceeded:
+            return (self.UNKNOWN, {})
+
+        if found:
+            return (self.FOUND, choice)
+        return (self.INFEASIBLE if self.exact else self.UNKNOWN, {})
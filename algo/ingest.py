@@ -0,0 +1,204 @@
+import time
+import json
+import random
+import hashlib
+import asyncio
+import logging
+import httpx
+from pymongo import ReplaceOne
+from utils.helpers import day_to_int, shorten_lesson_type, normalize_semester_data
+
+# Version of the module document layout, documents without a schema_version are version 1. Version 3 dropped the
+# per-class signatures and week masks from normalized_data
+SCHEMA_VERSION = 3
+
+INGEST_CONCURRENCY = 32
+INGEST_BATCH_SIZE = 200
+INGEST_RETRIES = 4
+# Seconds before the first retry, doubled on every further attempt
+INGEST_BACKOFF = 0.5
+INGEST_TIMEOUT = 30.0
+# Modules between progress log lines
+PROGRESS_INTERVAL = 500
+
+# Statuses worth retrying, anything else is treated as a permanent failure of that module
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+def content_hash(module_info: dict) -> str:
+    """Hash of a module document's content, equal for documents that would not change on a rewrite."""
+    content = {key: value for key, value in module_info.items() if key not in ('_id', 'content_hash')}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+def build_module_info(module_code: str, data: dict) -> dict:
+    """Module document for the NUSMods module JSON of module_code."""
+    module_info = {
+        'mod_id': module_code,
+        'mod_name': data['title'],
+        'schema_version': SCHEMA_VERSION,
+        'semester_data': {},
+        'normalized_data': {},
+    }
+    for sem_data in data['semesterData']:
+        semester = str(sem_data['semester'])
+        module_info['semester_data'][semester] = {}
+        for timetable in sem_data['timetable']:
+            # lesson_data -> dict
+            lesson_type = shorten_lesson_type(timetable['lessonType'])
+            class_no = timetable['classNo']
+
+            lesson_data = module_info['semester_data'][semester].get(lesson_type, {})
+            module_info['semester_data'][semester][lesson_type] = lesson_data
+
+            class_data = lesson_data.get(class_no, [])
+            class_data.append({
+                'class_no': timetable['classNo'],
+                'day': day_to_int(timetable['day']),
+                'start_time': timetable['startTime'],
+                'end_time': timetable['endTime'],
+            })
+            module_info['semester_data'][semester][lesson_type][class_no] = class_data
+        module_info['normalized_data'][semester] = normalize_semester_data(module_info['semester_data'][semester])
+
+    module_info['content_hash'] = content_hash(module_info)
+    return module_info
+
+class IngestStats:
+    """Counters of a single ingestion run."""
+
+    def __init__(self, module_codes: list = ()):
+        self.module_codes = module_codes
+        self.total = len(module_codes)
+        self.fetched = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.retries = 0
+        self.written = 0
+        self.batches = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Modules fetched per second."""
+        return self.fetched / max(self.elapsed, 1e-9)
+
+class CatalogIngestor:
+    """
+    Fetches the NUSMods module catalog into a collection.
+
+    Module JSONs are fetched concurrently over one pooled HTTP client, with at most concurrency requests in flight
+    and retries with exponential backoff. Documents are upserted on mod_id in batches of batch_size as they arrive,
+    so that at most a few batches are held in memory at any time.
+
+    known_hashes: {mod_id: content_hash} of the documents already stored, modules whose content hash is unchanged
+    are not written again
+    """
+
+    def __init__(self, base_url: str, collection, concurrency: int = INGEST_CONCURRENCY, batch_size: int = INGEST_BATCH_SIZE,
+                 retries: int = INGEST_RETRIES, backoff: float = INGEST_BACKOFF, timeout: float = INGEST_TIMEOUT,
+                 known_hashes: dict = None):
+        self.base_url = base_url
+        self.collection = collection
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.known_hashes = known_hashes or {}
+        self.stats = IngestStats()
+
+    async def _get_json(self, client: httpx.AsyncClient, path: str):
+        url = self.base_url % path
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await client.get(url)
+                if resp.status_code not in RETRY_STATUSES:
+                    resp.raise_for_status()
+                    return resp.json()
+                error = f'status {resp.status_code}'
+            except httpx.TransportError as e:
+                error = repr(e)
+            if attempt == self.retries:
+                raise RuntimeError(f'Giving up on {url} after {attempt + 1} attempts: {error}')
+            self.stats.retries += 1
+            # Jitter keeps concurrent retries from hitting the API in lockstep
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    async def _fetch_worker(self, client: httpx.AsyncClient, codes: asyncio.Queue, documents: asyncio.Queue) -> None:
+        while True:
+            module_code = await codes.get()
+            try:
+                data = await self._get_json(client, f'modules/{module_code}')
+                document = build_module_info(module_code, data)
+                if self.known_hashes.get(module_code) == document['content_hash']:
+                    self.stats.unchanged += 1
+                else:
+                    await documents.put(document)
+                self.stats.fetched += 1
+                if self.stats.fetched % PROGRESS_INTERVAL == 0:
+                    logger.info(f'Fetched {self.stats.fetched}/{self.stats.total} modules, {self.stats.throughput:.1f} modules/s')
+            except (httpx.HTTPError, RuntimeError, KeyError, ValueError) as e:
+                self.stats.failed += 1
+                logger.warning(f'Skipping {module_code}: {e!r}')
+            finally:
+                codes.task_done()
+
+    async def _write_batch(self, batch: list) -> None:
+        requests = [ReplaceOne({'mod_id': document['mod_id']}, document, upsert=True) for document in batch]
+        # pymongo is blocking, so writes run off the event loop while fetching carries on
+        await asyncio.to_thread(self.collection.bulk_write, requests, ordered=False)
+        self.stats.written += len(batch)
+        self.stats.batches += 1
+
+    async def _writer(self, documents: asyncio.Queue) -> None:
+        batch = []
+        while True:
+            document = await documents.get()
+            if document is None:
+                break
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                await self._write_batch(batch)
+                batch = []
+        if batch:
+            await self._write_batch(batch)
+
+    async def run(self, module_codes: list = None) -> IngestStats:
+        """Ingests module_codes, or every module in the catalog's module list. Returns the stats of the run."""
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout) as client:
+            if module_codes is None:
+                module_codes = [mod['moduleCode'] for mod in await self._get_json(client, 'moduleList')]
+            self.stats = IngestStats(module_codes)
+
+            codes = asyncio.Queue()
+            for module_code in module_codes:
+                codes.put_nowait(module_code)
+            # Bounded, so that fetching pauses when writes fall behind
+            documents = asyncio.Queue(maxsize=2 * self.batch_size)
+            writer = asyncio.create_task(self._writer(documents))
+            workers = [asyncio.create_task(self._fetch_worker(client, codes, documents)) for _ in range(self.concurrency)]
+            try:
+                fetched = asyncio.create_task(codes.join())
+                await asyncio.wait({fetched, writer}, return_when=asyncio.FIRST_COMPLETED)
+                if writer.done():
+                    # The writer only stops early on a failed write, whose error is raised here
+                    fetched.cancel()
+                    writer.result()
+                await documents.put(None)
+                await writer
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                writer.cancel()
+
+        stats = self.stats
+        logger.info(f'Ingested {stats.fetched}/{stats.total} modules in {stats.elapsed:.1f}s ({stats.throughput:.1f} modules/s, '
+                    f'{stats.written} written in {stats.batches} batches, {stats.unchanged} unchanged, {stats.retries} retries, '
+                    f'{stats.failed} failed)')
+        return stats
@@ -0,0 +1,404 @@
+import os
+import time
+import asyncio
+import itertools
+import threading
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from algo.mod_planner import ModPlanner
+from algo.session import PlanningSession
+from algo.cache import TTLCache
+from utils.metrics import observe_stages, observe_model_sizes
+
+SOLVER_PROCESSES = 2
+MAX_PENDING_JOBS = 16
+# Jobs that may wait for a free solver before new ones are turned away
+MAX_QUEUED_JOBS = 32
+# Jobs a single user may have queued or running at once
+MAX_USER_JOBS = 1
+# Expected cost a queued job gains in priority per second of waiting, so that expensive jobs are not starved
+QUEUE_AGING = 0.1
+JOB_DEADLINE = 600.0
+# Extra seconds a job gets to return its result after the solver has been told to stop
+STOP_GRACE_PERIOD = 5.0
+# Planning sessions every worker process keeps, and the seconds an unused one is kept
+MAX_WORKER_SESSIONS = 64
+WORKER_SESSION_TTL = 3600.0
+
+logger = logging.getLogger(__name__)
+
+class PlannerBusyError(Exception):
+    """Raised when the pool already holds its maximum number of pending jobs."""
+
+class PlanCancelledError(Exception):
+    """Raised when a job is cancelled before it finishes."""
+
+class PlanStoppedError(Exception):
+    """Raised when a job was stopped at its deadline, result holds whatever the planner had found by then."""
+
+    def __init__(self, result: tuple):
+        super().__init__(result)
+        self.result = result
+
+class PlanPreemptedError(Exception):
+    """Raised when a preemptible job gives up its slot to a job that would otherwise have to wait."""
+
+class UserBusyError(Exception):
+    """Raised when a user already has their maximum number of jobs queued or running."""
+
+# Session key -> PlanningSession of the worker process, set up by _init_worker
+_sessions = None
+
+def _init_worker(max_sessions: int, session_ttl: float) -> None:
+    global _sessions
+    _sessions = TTLCache(max_sessions, session_ttl)
+
+def _worker_session(session_key, blocked_days: list, blocked_timings: dict, planner: ModPlanner) -> PlanningSession:
+    """The worker's session for session_key constrained to the planner's request, built when it has none for its modules."""
+    session = _sessions.get(session_key)
+    if session is None or not session.matches(planner.modules, planner.sem):
+        session = PlanningSession(planner.modules, planner.sem, planner.mod_schedule, planner._mod_info_graph())
+        _sessions.set(session_key, session)
+    return session.constrain(blocked_days, blocked_timings, planner.max_hours, planner.filtered_schedule)
+
+def _plan(planner_args: tuple, planner_kwargs: dict, num_workers: int, time_limit: float, progress_queue, progress_key, stop_event) -> tuple:
+    """
+    Runs a ModPlanner inside a worker process, returns its result with the planner's stage timings and model sizes.
+
+    With a session_key and the request's session_constraints of (blocked_days, blocked_timings) among planner_kwargs,
+    the hard model comes from a PlanningSession that the worker keeps for that key.
+    """
+    planner_kwargs = dict(planner_kwargs)
+    session_key = planner_kwargs.pop('session_key', None)
+    session_constraints = planner_kwargs.pop('session_constraints', None)
+    if session_key is not None and _sessions is not None:
+        planner_kwargs['session_factory'] = functools.partial(_worker_session, session_key, *session_constraints)
+    on_solution = None
+    if progress_queue is not None:
+        on_solution = lambda url, violation_info: progress_queue.put((progress_key, url, violation_info))
+    planner = ModPlanner(*planner_args, num_workers=num_workers, time_limit=time_limit, stop_event=stop_event, **planner_kwargs)
+    result = planner.solve(on_solution)
+    return (result, planner.timings, planner.model_sizes)
+
+class PlannerPool:
+    """
+    Runs planning jobs on a bounded process pool, so that long solves never block the bot's event loop.
+
+    At most max_pending jobs are queued or running at once. Each job is stopped after deadline seconds, and jobs can be
+    cancelled by their id, which is the chat user in the bot. Every worker process keeps up to max_sessions planning
+    sessions, see _plan.
+    """
+
+    def __init__(self, processes: int = SOLVER_PROCESSES, max_pending: int = MAX_PENDING_JOBS, deadline: float = JOB_DEADLINE,
+                 max_sessions: int = MAX_WORKER_SESSIONS, session_ttl: float = WORKER_SESSION_TTL):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.deadline = deadline
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        # CP-SAT workers per solve, so that concurrent solves do not oversubscribe the machine
+        self.num_workers = max(1, (os.cpu_count() or 1) // processes)
+        self.pending = 0
+        self.stop_events = {}
+        self._executor = None
+        self._manager = None
+        self._progress_queue = None
+        self._forwarder = None
+        # Progress key -> (loop, on_solution) of the jobs that report progress
+        self._listeners = {}
+        self._progress_keys = itertools.count()
+
+    def _start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                                 initargs=(self.max_sessions, self.session_ttl))
+            # Queues and events have to be shared through a manager to be passed to pool workers
+            self._manager = multiprocessing.Manager()
+            # All jobs report progress on one queue, which a single thread hands to the event loop
+            self._progress_queue = self._manager.Queue()
+            self._forwarder = threading.Thread(target=self._forward_progress, args=(self._progress_queue,), daemon=True)
+            self._forwarder.start()
+
+    def _forward_progress(self, progress_queue) -> None:
+        while True:
+            try:
+                item = progress_queue.get()
+            except (EOFError, OSError):
+                # The manager has been shut down
+                return
+            if item is None:
+                return
+            progress_key, url, violation_info = item
+            listener = self._listeners.get(progress_key)
+            if listener is not None:
+                loop, on_solution = listener
+                loop.call_soon_threadsafe(on_solution, url, violation_info)
+
+    async def submit(self, job_id, planner_args: tuple, on_solution=None, planner_kwargs: dict = None, deadline: float = None) -> tuple:
+        """
+        Solves ModPlanner(*planner_args, **planner_kwargs) in a worker process and returns its (url, violation_info, errormsg).
+
+        on_solution is called on the event loop with every improving (url, violation_info) reported by the planner.
+        deadline overrides the pool's deadline for this job. A job stopped at its deadline raises PlanStoppedError with
+        the result it had by then.
+        """
+        deadline = deadline or self.deadline
+        if self.pending >= self.max_pending:
+            raise PlannerBusyError()
+        if job_id in self.stop_events:
+            self.cancel(job_id)
+
+        self._start()
+        self.pending += 1
+        stop_event = self._manager.Event()
+        self.stop_events[job_id] = stop_event
+        loop = asyncio.get_running_loop()
+        progress_queue = progress_key = None
+        if on_solution is not None:
+            progress_queue, progress_key = self._progress_queue, next(self._progress_keys)
+            self._listeners[progress_key] = (loop, on_solution)
+        try:
+            future = loop.run_in_executor(self._executor, _plan, planner_args, planner_kwargs or {}, self.num_workers, deadline,
+                                          progress_queue, progress_key, stop_event)
+
+            try:
+                result, timings, model_sizes = await asyncio.wait_for(asyncio.shield(future), deadline)
+            except asyncio.CancelledError:
+                # Nobody is waiting for the result any more
+                stop_event.set()
+                raise
+            except asyncio.TimeoutError:
+                logger.warning("Planning job %s passed its deadline of %ss, stopping it", job_id, deadline)
+                stop_event.set()
+                result, timings, model_sizes = await asyncio.wait_for(future, STOP_GRACE_PERIOD)
+            # Metrics live in this process, the worker only reports them back
+            observe_stages(timings)
+            observe_model_sizes(model_sizes)
+
+            if stop_event.is_set():
+                if self.stop_events.get(job_id) is not stop_event:
+                    raise PlanCancelledError()
+                # Cut short, so the result may be missing or worse than a finished solve would give
+                raise PlanStoppedError(result)
+            return result
+        finally:
+            self.pending -= 1
+            self._listeners.pop(progress_key, None)
+            if self.stop_events.get(job_id) is stop_event:
+                del self.stop_events[job_id]
+
+    def cancel(self, job_id) -> bool:
+        """Stops the job with the given id, returns whether there was one."""
+        stop_event = self.stop_events.pop(job_id, None)
+        if stop_event is None:
+            return False
+        stop_event.set()
+        return True
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._progress_queue.put(None)
+            self._forwarder.join(1.0)
+            self._manager.shutdown()
+            self._executor = None
+            self._manager = None
+            self._progress_queue = None
+            self._forwarder = None
+
+class _Flight:
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.listeners = []
+        self.latest = None
+
+    def notify(self, *args) -> None:
+        self.latest = args
+        for listener in list(self.listeners):
+            listener(*args)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single run.
+
+    The first call for a key starts func as a task, and every call for that key while it runs waits for the same task
+    and gets its result or exception. Progress reported by the task reaches every waiter. A waiter that is cancelled
+    only stops waiting, and the task itself is cancelled once nobody waits for it any more.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.calls = 0
+        # Calls that attached to a run that was already in flight
+        self.merges = 0
+
+    async def run(self, key, func, on_progress=None):
+        """
+        Returns the result of await func(notify), sharing it with every concurrent call for key.
+
+        notify(*args) passes progress to the on_progress callables of all waiters, late joiners get the latest one.
+        """
+        self.calls += 1
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = _Flight()
+            flight.task = asyncio.create_task(func(flight.notify))
+
+            def forget(_):
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.task.add_done_callback(forget)
+        else:
+            self.merges += 1
+            logger.info("Request %s attached to a plan already in flight", key)
+
+        flight.waiters += 1
+        if on_progress is not None:
+            flight.listeners.append(on_progress)
+            if flight.latest is not None:
+                on_progress(*flight.latest)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if on_progress is not None:
+                flight.listeners.remove(on_progress)
+            if flight.waiters == 0 and not flight.task.done():
+                # A new call for key must start afresh rather than join a run that is being cancelled
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
+
+class _QueuedJob:
+    def __init__(self, cost: float, on_position):
+        self.cost = cost
+        self.on_position = on_position
+        self.enqueued = time.monotonic()
+        self.position = None
+        self.ready = asyncio.get_running_loop().create_future()
+
+class JobScheduler:
+    """
+    Admits planning jobs to a fixed number of solver slots.
+
+    Jobs beyond the free slots wait in a queue of at most max_queued jobs, further jobs are shed with PlannerBusyError.
+    Every user may have at most max_user_jobs jobs queued or running. A freed slot goes to the queued job with the
+    lowest expected cost, less aging for every second it has waited, and waiting jobs are told their queue position
+    whenever it changes.
+
+    Preemptible jobs only ever take a free slot, and are stopped as soon as another job has to queue.
+    """
+
+    def __init__(self, slots: int = SOLVER_PROCESSES, max_queued: int = MAX_QUEUED_JOBS, max_user_jobs: int = MAX_USER_JOBS,
+                 aging: float = QUEUE_AGING):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.max_user_jobs = max_user_jobs
+        self.aging = aging
+        self.running = 0
+        self.queue = []
+        self.user_jobs = {}
+        self.shed = 0
+        # Tasks of the running preemptible jobs, and those of them already told to stop
+        self.preemptible = []
+        self.preempted = set()
+
+    @property
+    def has_free_slot(self) -> bool:
+        return self.running < self.slots
+
+    def _priority(self, job: _QueuedJob, now: float) -> float:
+        return job.cost - self.aging * (now - job.enqueued)
+
+    def _report_positions(self) -> None:
+        now = time.monotonic()
+        self.queue.sort(key=lambda job: self._priority(job, now))
+        for position, job in enumerate(self.queue, 1):
+            if job.position != position:
+                job.position = position
+                if job.on_position is not None:
+                    job.on_position(position)
+
+    def _preempt(self) -> None:
+        for task in self.preemptible:
+            if task not in self.preempted:
+                self.preempted.add(task)
+                task.cancel()
+                return
+
+    def _release(self) -> None:
+        if self.queue:
+            # The slot passes straight to the next job, so running stays the same
+            self._report_positions()
+            job = self.queue.pop(0)
+            job.ready.set_result(None)
+            if job.on_position is not None:
+                job.on_position(0)
+            self._report_positions()
+        else:
+            self.running -= 1
+
+    async def _run_preemptible(self, func):
+        task = asyncio.ensure_future(func())
+        self.preemptible.append(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Only the job itself was cancelled, not its caller
+            if task in self.preempted and not asyncio.current_task().cancelling():
+                raise PlanPreemptedError() from None
+            raise
+        finally:
+            self.preemptible.remove(task)
+            self.preempted.discard(task)
+
+    async def run(self, user_id, cost: float, func, on_position=None, preemptible: bool = False):
+        """
+        Returns await func() once a slot is free for it.
+
+        cost: expected cost of the job, cheaper jobs are started first
+        on_position: called with the job's 1-based queue position while it waits, and with 0 once it leaves the queue
+        preemptible: the job is turned away with PlannerBusyError instead of queueing, and cancelled with
+        PlanPreemptedError once another job has to queue
+        """
+        if self.user_jobs.get(user_id, 0) >= self.max_user_jobs:
+            raise UserBusyError()
+        if preemptible and not self.has_free_slot:
+            raise PlannerBusyError()
+        if self.running >= self.slots and len(self.queue) >= self.max_queued and len(self.preempted) >= len(self.preemptible):
+            self.shed += 1
+            raise PlannerBusyError()
+
+        self.user_jobs[user_id] = self.user_jobs.get(user_id, 0) + 1
+        try:
+            if self.running < self.slots:
+                self.running += 1
+            else:
+                job = _QueuedJob(cost, on_position)
+                self.queue.append(job)
+                self._report_positions()
+                self._preempt()
+                try:
+                    await job.ready
+                    observe_stages({'queue_wait': time.monotonic() - job.enqueued})
+                except asyncio.CancelledError:
+                    if job in self.queue:
+                        self.queue.remove(job)
+                        self._report_positions()
+                    elif job.ready.done() and not job.ready.cancelled():
+                        # The slot was handed over just before the cancellation
+                        self._release()
+                    raise
+            try:
+                if preemptible:
+                    return await self._run_preemptible(func)
+                return await func()
+            finally:
+                self._release()
+        finally:
+            self.user_jobs[user_id] -= 1
+            if not self.user_jobs[user_id]:
+                del self.user_jobs[user_id]
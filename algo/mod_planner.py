@@ -1,57 +1,111 @@
+import os
+import time
+import logging
+import threading
 from ortools.sat.python import cp_model
 from collections import defaultdict
-from utils.helpers import url_generator, int_to_days, parse_time, format_time, single_timeslot_filter, check_overlaps
+from algo.conflict_graph import ConflictGraph
+from algo.fast_path import FastPathSolver
+from utils.schedule import ScheduleData
+from utils.clashes import Clash
+from utils.helpers import url_generator, int_to_days, parse_time, lesson_minutes
+
+SOLVER_TIME_LIMIT = 600.0
+# CP-SAT runs its search portfolio across this many workers and stops as soon as one proves optimality
+NUM_WORKERS = os.cpu_count() or 8
+# How often a running solve checks whether it has been asked to stop
+STOP_POLL_INTERVAL = 0.1
+
+logger = logging.getLogger(__name__)
+
+class _ProgressCallback(cp_model.CpSolverSolutionCallback):
+    """Passes every improving solution to on_solution(url, violation_info) while CP-SAT keeps searching."""
+
+    def __init__(self, planner, info_source: list, on_solution, relaxed: bool):
+        super().__init__()
+        self.planner = planner
+        self.info_source = info_source
+        self.on_solution = on_solution
+        self.relaxed = relaxed
+
+    def on_solution_callback(self):
+        url = self.planner._url_from_choice(self.planner._choice_from(self), self.info_source, verbose=False)
+        violation_info = self.planner._breach_summary(self)[1] if self.relaxed else ""
+        self.on_solution(url, violation_info)
 
 class ModPlanner:
-    def __init__(self, modules: list, mod_info: list, sem: str, max_hours: int, blocked_timings: dict, filtered_info: list):
+    def __init__(self, modules: list, mod_info: list, sem: str, max_hours: int, blocked_timings: dict, filtered_info: list,
+                 num_workers: int = NUM_WORKERS, time_limit: float = SOLVER_TIME_LIMIT, fast_path: bool = True, stop_event=None,
+                 equivalent_classes: list = None, hint: dict = None, conflict_graph: ConflictGraph = None, session=None,
+                 session_factory=None):
         self.modules = modules
-        self.mod_info = mod_info
-        self.filtered_info = filtered_info
+        # Both views are accepted as ScheduleData or in the shape drawn from the database, and kept in both forms
+        self.mod_schedule = conflict_graph.schedule if conflict_graph is not None else ScheduleData.coerce(mod_info)
+        self.filtered_schedule = ScheduleData.coerce(filtered_info)
+        self.mod_info = mod_info.to_mod_info() if isinstance(mod_info, ScheduleData) else mod_info
+        self.filtered_info = filtered_info.to_mod_info() if isinstance(filtered_info, ScheduleData) else filtered_info
         self.sem = sem
         self.max_hours = max_hours
         self.max_mins = max_hours * 60
         self.blocked_timings = blocked_timings
+        # Blocked timings parsed once into (block, start, end) with minutes since midnight
+        self.blocked_ranges = {}
+        for day, blocked in blocked_timings.items():
+            self.blocked_ranges[day] = []
+            for block in blocked:
+                block_start, block_end = map(parse_time, block.split('-'))
+                self.blocked_ranges[day].append((block, block_start, block_end))
         self.interval_name_map = {}
         self.hard_url = True
+        self.num_workers = num_workers
+        self.time_limit = time_limit
+        self.fast_path = fast_path
+        # Any object with is_set() and wait(timeout), setting it stops the running solve as soon as possible
+        self.stop_event = stop_event
+        # Per module {class_type: {class_no: [interchangeable class_nos]}} for classes dropped as duplicates
+        self.equivalent_classes = equivalent_classes or [{} for _ in modules]
+        # (module_idx, class_type) -> class_no of an earlier timetable, which the search tries first
+        self.hint = hint or {}
+        if conflict_graph is not None:
+            # Built ahead of the request from the same mod_info
+            self._mod_info_conflict_graph = conflict_graph
+        # PlanningSession holding a hard model of mod_info that is already constrained to this request
+        self.session = session
+        # Called with the planner for such a session once the hard model is needed, which it never is when the fast path
+        # settles the request
+        self.session_factory = session_factory
+        # Seconds spent in every stage of solve, and the (variables, constraints) of every model solved
+        self.timings = {}
+        self.model_sizes = []
+
+    def _timed(self, stage: str, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
     
     def _add_constraints(self, hard=True):
-        overlap_vars = []
+        # presence index -> (presence, number of overlaps with blocked timings when the class is taken)
+        overlap_penalties = {}
         excess_lesson_vars = []
 
         if not hard:
-            for day, blocked in self.blocked_timings.items():
-                for interval, presence, _ in self.intervals_per_day[day]:
-                    for block in blocked:
-                        block_start, block_end = map(parse_time, block.split('-'))
-                        # Define overlap variable for each interval
-                        overlap_var = self.model.NewBoolVar(f'overlap_{interval.Name()}_{block}')
-                        overlap_vars.append(overlap_var)
-
-                        # Determine if the interval overlaps with the block
-                        interval_start = interval.StartExpr()
-                        interval_end = interval.EndExpr()
-
-                        # Calculate if there's an overlap
-                        self.model.Add(interval_start < block_end).OnlyEnforceIf(overlap_var)
-                        self.model.Add(interval_end > block_start).OnlyEnforceIf(overlap_var)
-                        self.model.AddImplication(overlap_var, presence)
+            # Lesson times are fixed, so every overlap with a blocked timing is known before solving
+            for day, blocked in self.blocked_ranges.items():
+                for _, presence, _, interval_start, interval_end in self.intervals_per_day[day]:
+                    for _, block_start, block_end in blocked:
+                        if interval_start < block_end and interval_end > block_start:
+                            penalty = overlap_penalties.get(presence.Index(), (presence, 0))[1]
+                            overlap_penalties[presence.Index()] = (presence, penalty + 1)
 
         for day, interval_pairs in self.intervals_per_day.items():
             if len(interval_pairs) > 1:
-                active_intervals = []
                 daily_durations = []
                 total_duration_var = self.model.NewIntVar(0, self.horizon, f'total_duration_day_{day}')
-                for interval, presence, duration in interval_pairs:
-                    active_interval = self.model.NewOptionalIntervalVar(
-                        interval.StartExpr(), 
-                        interval.SizeExpr(), 
-                        interval.EndExpr(), presence, 
-                        f'active_{interval.Name()}'
-                    )
-                    active_intervals.append(active_interval)
+                for _, presence, duration, _, _ in interval_pairs:
                     daily_durations.append(duration * presence)
 
-                self.model.AddNoOverlap(active_intervals)
                 self.model.Add(total_duration_var == sum(daily_durations))
 
                 if hard:
@@ -63,8 +117,9 @@ class ModPlanner:
 
                     # Add constraint to calculate excess lessons
                     self.model.Add(total_duration_var > self.max_mins).OnlyEnforceIf(excess_lesson_var)
+                    self.model.Add(total_duration_var <= self.max_mins).OnlyEnforceIf(excess_lesson_var.Not())
 
-        return overlap_vars, excess_lesson_vars
+        return list(overlap_penalties.values()), excess_lesson_vars
     
     def _reinitialize_model(self, hard=True):
         self.model = cp_model.CpModel()
@@ -73,151 +128,318 @@ class ModPlanner:
         self.ends = {}
         self.presences = {}
         self.durations = {}
-        self.all_intervals = []
         self.horizon = 0
 
-        info_source = self.filtered_info if hard else self.mod_info
-
-        for module_idx, module in enumerate(self.modules):
-            module_data = info_source[module_idx]
-            for class_type, lessons in module_data.items():
-                for class_no, class_list in lessons.items():
-                    presence_var = self.model.NewBoolVar(f'presence_{module}_{class_type}_{class_no}')
-                    self.presences[(module_idx, class_type, class_no)] = presence_var
-                    for class_instance_idx, class_info in enumerate(class_list):
-                        day = class_info['day']
-                        start_time = parse_time(class_info['start_time'])
-                        end_time = parse_time(class_info['end_time'])
-                        duration = end_time - start_time
-                        self.horizon = max(self.horizon, end_time)
-
-                        start_var = self.model.NewIntVar(0, self.horizon, f'start_{module}_{class_type}_{class_no}_{class_instance_idx}')
-                        end_var = self.model.NewIntVar(0, self.horizon, f'end_{module}_{class_type}_{class_no}_{class_instance_idx}')
-                        interval_var = self.model.NewIntervalVar(start_var, duration, end_var, f'interval_{module}_{class_type}_{class_no}_{class_instance_idx}')
-
-                        self.interval_name_map[interval_var.Name()] = f'{module} {class_type} {class_no}'
-
-                        self.starts[(module_idx, class_type, class_no, class_instance_idx)] = start_var
-                        self.ends[(module_idx, class_type, class_no, class_instance_idx)] = end_var
-                        self.durations[(module_idx, class_type, class_no, class_instance_idx)] = duration
-                        self.intervals_per_day[day].append((interval_var, presence_var, duration))
-
-                        self.model.Add(start_var == start_time).OnlyEnforceIf(presence_var)
-                        self.model.Add(end_var == end_time).OnlyEnforceIf(presence_var)
-
-        for module_idx, module in enumerate(self.modules):
-            module_data = info_source[module_idx]
-            for class_type in module_data.keys():
-                class_nos = list(module_data[class_type].keys())
-                presence_vars = [self.presences[(module_idx, class_type, class_no)] for class_no in class_nos]
-                self.model.Add(sum(presence_vars) == 1)
-
-        self.overlap_vars, self.excess_lesson_vars = self._add_constraints(hard=hard)
+        schedule = self.filtered_schedule if hard else self.mod_schedule
+
+        # class_idx -> (module_idx, class_type, class_no) and its presence
+        class_keys = []
+        class_presences = []
+        for module_idx, type_idx, class_no in zip(schedule.class_module.tolist(), schedule.class_type.tolist(), schedule.class_nos):
+            class_type = schedule.type_names[type_idx]
+            presence_var = self.model.NewBoolVar(f'presence_{self.modules[module_idx]}_{class_type}_{class_no}')
+            self.presences[(module_idx, class_type, class_no)] = presence_var
+            class_keys.append((module_idx, class_type, class_no))
+            class_presences.append(presence_var)
+
+        class_offsets = schedule.class_offsets.tolist()
+        for row, (class_idx, day, start_time, end_time) in enumerate(zip(schedule.class_idx.tolist(), schedule.day.tolist(), schedule.start.tolist(), schedule.end.tolist())):
+            module_idx, class_type, class_no = class_keys[class_idx]
+            module = self.modules[module_idx]
+            class_instance_idx = row - class_offsets[class_idx]
+            duration = end_time - start_time
+            self.horizon = max(self.horizon, end_time)
+
+            # Every lesson has a fixed time, so only its presence is a decision
+            lesson_name = f'interval_{module}_{class_type}_{class_no}_{class_instance_idx}'
+            self.interval_name_map[lesson_name] = f'{module} {class_type} {class_no}'
+
+            self.starts[(module_idx, class_type, class_no, class_instance_idx)] = start_time
+            self.ends[(module_idx, class_type, class_no, class_instance_idx)] = end_time
+            self.durations[(module_idx, class_type, class_no, class_instance_idx)] = duration
+            self.intervals_per_day[day].append((lesson_name, class_presences[class_idx], duration, start_time, end_time))
+
+        type_offsets = schedule.type_offsets.tolist()
+        for type_idx in range(len(schedule.type_names)):
+            self.model.Add(sum(class_presences[type_offsets[type_idx]:type_offsets[type_idx + 1]]) == 1)
+
+        for (module_idx, class_type, class_no), presence_var in self.presences.items():
+            hinted_class_no = self.hint.get((module_idx, class_type))
+            if hinted_class_no is not None:
+                self.model.AddHint(presence_var, hinted_class_no == class_no)
+
+        # Clashes between fixed lessons are cliques of class options that can not be taken together
+        self.conflict_graph = self._mod_info_graph() if schedule is self.mod_schedule else ConflictGraph(schedule)
+        for clique in self.conflict_graph.clique_options():
+            self.model.AddAtMostOne(self.presences[option] for option in clique)
+
+        self.overlap_penalties, self.excess_lesson_vars = self._add_constraints(hard=hard)
         
         if not hard:
-            self.model.Minimize(sum(self.overlap_vars) + sum(self.excess_lesson_vars))
+            presence_vars = [presence for presence, _ in self.overlap_penalties] + self.excess_lesson_vars
+            weights = [penalty for _, penalty in self.overlap_penalties] + [1] * len(self.excess_lesson_vars)
+            self.model.Minimize(cp_model.LinearExpr.WeightedSum(presence_vars, weights))
                 
-    def solve(self):
-        # Initial solve with hard constraints
-        self._reinitialize_model(hard=True)
-
-        # Solve the model with hard constraints
+    def _new_solver(self):
         solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 600.0  # Allow more time for the solver
-        status = solver.Solve(self.model)
+        solver.parameters.max_time_in_seconds = self.time_limit
+        solver.parameters.num_workers = self.num_workers
+        if self.hint:
+            # Otherwise presolve may drop solutions such as the hinted one, and the hint gets lost
+            solver.parameters.keep_all_feasible_solutions_in_presolve = True
+        return solver
+
+    def explain_infeasibility(self, soft=True) -> list:
+        """
+        Smallest set of requested conditions that can not all be met, or an empty list if they can.
+
+        Every module, and with soft also every blocked day, blocked timing and daily hours limit, is put behind an
+        assumption literal. A single solve then returns the assumptions CP-SAT needed to prove infeasibility, which are
+        shrunk to a minimal set with a few more solves on the much smaller remainder.
+        Conditions are returned as ('module', module_idx), ('blocked', day, block) or ('max_hours', day).
+        """
+        model = cp_model.CpModel()
+        presences = {}
+        lessons_per_day = defaultdict(list)
+        assumptions = {}
+
+        for module_idx, module in enumerate(self.modules):
+            module_lit = model.NewBoolVar(f'assume_module_{module}')
+            assumptions[module_lit.Index()] = (module_lit, ('module', module_idx))
+            for class_type, lessons in self.mod_info[module_idx].items():
+                presence_vars = []
+                for class_no, class_list in lessons.items():
+                    presence_var = model.NewBoolVar(f'presence_{module}_{class_type}_{class_no}')
+                    presences[(module_idx, class_type, class_no)] = presence_var
+                    presence_vars.append(presence_var)
+                    for class_info in class_list:
+                        start_time, end_time = lesson_minutes(class_info)
+                        lessons_per_day[class_info['day']].append((presence_var, start_time, end_time))
+                model.Add(sum(presence_vars) == 1).OnlyEnforceIf(module_lit)
+
+        for clique in self._mod_info_graph().clique_options():
+            model.AddAtMostOne(presences[option] for option in clique)
+
+        if soft:
+            for day, blocked in self.blocked_ranges.items():
+                for block, block_start, block_end in blocked:
+                    block_lit = model.NewBoolVar(f'assume_block_{day}_{block}')
+                    assumptions[block_lit.Index()] = (block_lit, ('blocked', day, block))
+                    for presence_var, start_time, end_time in lessons_per_day[day]:
+                        if start_time < block_end and end_time > block_start:
+                            model.AddImplication(block_lit, presence_var.Not())
+
+            for day, day_lessons in lessons_per_day.items():
+                # Same as the hard model, which only limits days with more than one lesson
+                if len(day_lessons) > 1 and sum(end_time - start_time for _, start_time, end_time in day_lessons) > self.max_mins:
+                    hours_lit = model.NewBoolVar(f'assume_max_hours_{day}')
+                    assumptions[hours_lit.Index()] = (hours_lit, ('max_hours', day))
+                    model.Add(sum((end_time - start_time) * presence_var for presence_var, start_time, end_time in day_lessons) <= self.max_mins).OnlyEnforceIf(hours_lit)
+
+        def core_of(literal_indices):
+            model.ClearAssumptions()
+            model.AddAssumptions([assumptions[index][0] for index in literal_indices])
+            solver = cp_model.CpSolver()
+            solver.parameters.max_time_in_seconds = self.time_limit
+            # Assumption cores are only reported by the single worker search
+            solver.parameters.num_workers = 1
+            if self._run_solver(solver, model) != cp_model.INFEASIBLE:
+                return None
+            return list(solver.SufficientAssumptionsForInfeasibility())
+
+        core = core_of(list(assumptions))
+        if core is None:
+            return []
+
+        # Drop every condition the remaining ones are still infeasible without
+        idx = 0
+        while idx < len(core):
+            smaller_core = core_of(core[:idx] + core[idx + 1:])
+            if smaller_core is None:
+                idx += 1
+            else:
+                core = [index for index in core if index in smaller_core]
+        return [assumptions[index][1] for index in core]
+
+    def describe_condition(self, condition: tuple) -> str:
+        if condition[0] == 'module':
+            return f'module {self.modules[condition[1]]}'
+        if condition[0] == 'blocked':
+            day, block = condition[1], condition[2]
+            if block == '0000-2359':
+                return f'blocked day on {int_to_days(day)}'
+            return f'blocked timing {block} on {int_to_days(day)}'
+        return f'attention span limiter of {self.max_hours} hours on {int_to_days(condition[1])}'
+
+    def _mod_info_graph(self) -> ConflictGraph:
+        if not hasattr(self, '_mod_info_conflict_graph'):
+            self._mod_info_conflict_graph = ConflictGraph(self.mod_schedule)
+        return self._mod_info_conflict_graph
+
+    def _clash_report(self, clashing_modules: list) -> str:
+        errormsg = ""
+        covered = False
+        # Clashes between lesson types with a single option can never be avoided, so all of them are listed
+        for (i, j), clashes in self._mod_info_graph().clash_records(single_only=True).items():
+            if i in clashing_modules and j in clashing_modules:
+                covered = True
+            logger.info("Irreconcilable clashes found", extra={'module1': self.modules[i], 'module2': self.modules[j], 'clashes': len(clashes)})
+            errormsg += f"\nIrreconcilable clashes found between {self.modules[i]} and {self.modules[j]}:\n"
+
+            for overlap in map(Clash.as_overlap, clashes):
+                logger.debug("Irreconcilable clash", extra={'lesson1': f"{self.modules[i]} {overlap['module1']}", 'lesson2': f"{self.modules[j]} {overlap['module2']}"})
+                errormsg += f"{self.modules[i]} {overlap['module1']}, clashes with {self.modules[j]} {overlap['module2']}.\n\n"
+
+        if not covered:
+            # The clash involves lesson types with several options, none of which fit together
+            names = [self.modules[module_idx] for module_idx in sorted(clashing_modules)]
+            names = f"{', '.join(names[:-1])} and {names[-1]}" if len(names) > 1 else names[0]
+            logger.info("Irreconcilable clashes found", extra={'modules': [self.modules[module_idx] for module_idx in sorted(clashing_modules)]})
+            errormsg += f"\nIrreconcilable clashes found between {names}:\nEvery combination of their classes has at least one clash.\n\n"
+        return errormsg
+
+    def _stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _run_solver(self, solver, model, callback=None):
+        proto = model.Proto()
+        self.model_sizes.append((len(proto.variables), len(proto.constraints)))
+        if self.stop_event is None:
+            return solver.Solve(model, callback)
+        if self._stopped():
+            return cp_model.UNKNOWN
+
+        finished = threading.Event()
+
+        def stop_when_requested():
+            while not finished.is_set():
+                if self.stop_event.wait(STOP_POLL_INTERVAL):
+                    solver.StopSearch()
+                    return
+
+        watcher = threading.Thread(target=stop_when_requested, daemon=True)
+        watcher.start()
+        try:
+            return solver.Solve(model, callback)
+        finally:
+            finished.set()
+
+    def solve(self, on_solution=None):
+        """
+        Returns (url, violation_info, errormsg).
+
+        on_solution: optional callable taking (url, violation_info), called with each improving timetable as soon as it
+        is found, so that callers can show a usable result long before optimality is proven.
+        """
         best_info = ""
         errormsg = ""
 
+        # Most requests are easy, so try a quick bitmask search before paying for the CP-SAT model
+        status = cp_model.UNKNOWN
+        if self.fast_path:
+            fast_status, choice = self._timed('fast_path', FastPathSolver(self.filtered_schedule, self.max_mins, hint=self.hint).solve)
+            if fast_status == FastPathSolver.FOUND:
+                result = self._timed('url', self._url_from_choice, choice, self.filtered_info)
+                if on_solution is not None:
+                    on_solution(result, best_info)
+                return (result, best_info, errormsg)
+            if fast_status == FastPathSolver.INFEASIBLE:
+                status = cp_model.INFEASIBLE
+
+        if status == cp_model.UNKNOWN:
+            # Initial solve with hard constraints
+            if self.session is None and self.session_factory is not None:
+                self.session = self._timed('session', self.session_factory, self)
+            if self.session is not None:
+                self.model = self._timed('model_build', self.session.prepare_model, self.hint)
+                self.presences = self.session.presences
+            else:
+                self._timed('model_build', self._reinitialize_model, True)
+
+            # Solve the model with hard constraints
+            solver = self._new_solver()
+            callback = _ProgressCallback(self, self.filtered_info, on_solution, relaxed=False) if on_solution else None
+            status = self._timed('hard_solve', self._run_solver, solver, self.model, callback)
+
         if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
-            print("Unable to find solution with all the constraints, finding a good possible solution...\n")
+            if self._stopped():
+                return ("", best_info, errormsg)
+
+            # Clashes between modules can not be relaxed, so look for them first
+            clashing_modules = [condition[1] for condition in self._timed('explain', self.explain_infeasibility, False)]
+            if clashing_modules:
+                logger.info("No feasible solution found with relaxed constraints")
+                return ("", best_info, self._clash_report(clashing_modules))
+
+            logger.info("Unable to find solution with all the constraints, finding a good possible solution")
             # If no solution found, reinitialize model with soft constraints to minimize overlap
             self.hard_url = False
-            self._reinitialize_model(hard=False)
-
-            best_breach = float('inf')
-            best_solver = None
-            best_status = None
-
-            # Multiple runs with different seeds
-            for seed in range(10):
-                solver = cp_model.CpSolver()
-                solver.parameters.random_seed = seed
-                solver.parameters.max_time_in_seconds = 600.0  # Increase time limit
-                status = solver.Solve(self.model)
-                if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:  
-                    current_breach_info = self.calculate_total_overlap(solver)
-                    current_breach = current_breach_info[0]
-                    if current_breach < best_breach:
-                        best_breach = current_breach
-                        best_solver = solver
-                        best_status = status
-                        best_info = current_breach_info[1]
-
-            if best_solver is not None and best_status is not None:
-                result = self._parse_results(best_solver, best_status)
+            self._timed('model_build', self._reinitialize_model, False)
+
+            # A single parallel portfolio solve, the workers share bounds and stop once a zero-breach solution is proven
+            solver = self._new_solver()
+            callback = _ProgressCallback(self, self.mod_info, on_solution, relaxed=True) if on_solution else None
+            status = self._timed('relaxed_solve', self._run_solver, solver, self.model, callback)
+            if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+                best_info = self.calculate_total_overlap(solver)[1]
+                conflicting = [] if self._stopped() else self._timed('explain', self.explain_infeasibility, True)
+                if conflicting:
+                    best_info += "\nThe following conditions cannot all be met together:\n"
+                    best_info += ''.join(f"- {self.describe_condition(condition)}\n" for condition in conflicting)
+                result = self._parse_results(solver, status)
             else:
-                #Reinitialise again to find out clashes in lessons
-                print("No feasible solution found with relaxed constraints.\n")
+                logger.info("No feasible solution found with relaxed constraints")
                 result = ""
-                single_info = single_timeslot_filter(self.mod_info) #filtering only lesson_info that only has 1 possible timing and day
-                length = len(self.modules)
-                for i in range(length):
-                    #checking for filtered info
-                    if not single_info[i]:
-                        continue
-
-                    for j in range(i+1, length):
-                        if not single_info[j]:
-                            continue
-
-                        overlaps = check_overlaps(single_info[i], single_info[j])
-                        if overlaps:
-                            print(f"Irreconcilable clashes found between {self.modules[i]} and {self.modules[j]}:")
-                            errormsg += f"\nIrreconcilable clashes found between {self.modules[i]} and {self.modules[j]}:\n"
-
-                            for overlap in overlaps:
-                                print(f"{self.modules[i]} {overlap['module1']}, clashes with {self.modules[j]} {overlap['module2']}.")
-                                errormsg += f"{self.modules[i]} {overlap['module1']}, clashes with {self.modules[j]} {overlap['module2']}.\n\n"
         else:
             result = self._parse_results(solver, status)
 
-        print(best_info)
+        if best_info:
+            logger.info("Constraints breached", extra={'breaches': best_info.strip()})
         return (result, best_info, errormsg)
 
-    def _parse_results(self, solver, status):
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            url_info = [[] for _ in range(len(self.modules))]
-            info_source = self.filtered_info if self.hard_url else self.mod_info
-            for module_idx, module in enumerate(self.modules):
-                for class_type in info_source[module_idx].keys():
-                    for class_no in info_source[module_idx][class_type].keys():
-                        if solver.Value(self.presences[(module_idx, class_type, class_no)]):
-                            url_info[module_idx].append(f"{class_type}:{class_no},")
-                            for class_instance_idx, class_info in enumerate(info_source[module_idx][class_type][class_no]):
-                                start = solver.Value(self.starts[(module_idx, class_type, class_no, class_instance_idx)])
-                                end = solver.Value(self.ends[(module_idx, class_type, class_no, class_instance_idx)])
-                                day = class_info['day']
-                                start_time = format_time(start)
-                                end_time = format_time(end)
-                                print(f"Module {module}, {class_type} {class_no}: Day {day}, starts at {start_time} and ends at {end_time}")
-            print("\nStatistics")
-            print(f"  - conflicts      : {solver.NumConflicts()}")
-            print(f"  - branches       : {solver.NumBranches()}")
-            print(f"  - wall time      : {solver.WallTime()} s")
-            return url_generator(self.modules, url_info, self.sem)
-        else:
-            print("No solution found.")
-
-        print("\nStatistics")
-        print(f"  - conflicts      : {solver.NumConflicts()}")
-        print(f"  - branches       : {solver.NumBranches()}")
-        print(f"  - wall time      : {solver.WallTime()} s")
+    def _choice_from(self, values) -> dict:
+        """Selected class_no per (module_idx, class_type), read from a solver or solution callback."""
+        choice = {}
+        for (module_idx, class_type, class_no), presence in self.presences.items():
+            if values.Value(presence):
+                choice[(module_idx, class_type)] = class_no
+        return choice
+
+    def _url_from_choice(self, choice: dict, info_source: list, verbose: bool = True) -> str:
+        """Builds the NUSMods URL from a mapping of (module_idx, class_type) to the selected class_no."""
+        url_info = [[] for _ in range(len(self.modules))]
+        for module_idx, module in enumerate(self.modules):
+            for class_type in info_source[module_idx].keys():
+                class_no = choice.get((module_idx, class_type))
+                if class_no is None:
+                    continue
+                url_info[module_idx].append(f"{class_type}:{class_no},")
+                if not verbose:
+                    continue
+                for class_info in info_source[module_idx][class_type][class_no]:
+                    logger.debug("Selected lesson", extra={'module': module, 'class_type': class_type, 'class_no': class_no, 'day': class_info['day'],
+                                                           'start_time': class_info['start_time'], 'end_time': class_info['end_time']})
+                alternatives = self.equivalent_classes[module_idx].get(class_type, {}).get(class_no, [])
+                if alternatives:
+                    logger.debug("Interchangeable classes", extra={'module': module, 'class_type': class_type, 'class_no': class_no, 'alternatives': alternatives})
+        return url_generator(self.modules, url_info, self.sem)
 
-        return ""
+    def _parse_results(self, solver, status):
+        solved = status == cp_model.OPTIMAL or status == cp_model.FEASIBLE
+        logger.info("Solver statistics", extra={'status': solver.StatusName(status), 'conflicts': solver.NumConflicts(),
+                                                 'branches': solver.NumBranches(), 'wall_time': solver.WallTime()})
+        if not solved:
+            logger.info("No solution found")
+            return ""
+        info_source = self.filtered_info if self.hard_url else self.mod_info
+        return self._timed('url', self._url_from_choice, self._choice_from(solver), info_source)
     
     def calculate_total_overlap(self, solver):
         if not (solver.StatusName() == 'OPTIMAL' or solver.StatusName() == 'FEASIBLE'):  
             return (float('inf'), 'Solver did not find a feasible solution.')
+        return self._breach_summary(solver)
+
+    def _breach_summary(self, values):
         total_overlap = 0
         total_excess_lessons = 0
         overlap_info = "\nLessons that overlap with blocked days or timings:\n\n"
@@ -227,31 +449,27 @@ class ModPlanner:
 
         for day in sorted_days:
             intervals = self.intervals_per_day[day]
-            blocked = self.blocked_timings.get(day, [])
+            blocked = self.blocked_ranges.get(day, [])
             total_duration = 0
             day_excess_info = f'Lessons exceeding attention span limiter of {self.max_hours} on {int_to_days(day)}:\n'
-            for interval, presence, duration in intervals:
-                if solver.BooleanValue(presence):
-                    interval_start = solver.Value(interval.StartExpr())
-                    interval_end = solver.Value(interval.EndExpr())
-                    
+            for lesson_name, presence, duration, interval_start, interval_end in intervals:
+                if values.BooleanValue(presence):
                     # Check for overlaps with blocked timings
-                    for block in blocked:
-                        block_start, block_end = map(parse_time, block.split('-'))
+                    for block, block_start, block_end in blocked:
                         if block == '0000-2359':
                             block_string = 'blocked day'
                         else:
                             block_string = f'blocked timing {block}'
                         if interval_start < block_end and interval_end > block_start:
                             total_overlap += 1
-                            interval_name = self.interval_name_map[interval.Name()]
+                            interval_name = self.interval_name_map[lesson_name]
                             overlap_info += f'{interval_name} overlaps with {block_string} on {int_to_days(day)}.\n'
                     
                     # Check for excess duration
                     total_duration += duration
                     if total_duration > self.max_mins:
                         total_excess_lessons += 1
-                        interval_name = self.interval_name_map[interval.Name()]
+                        interval_name = self.interval_name_map[lesson_name]
                         day_excess_info += f'{interval_name}\n'
 
             if total_duration > self.max_mins:
@@ -0,0 +1,138 @@
+import math
+import time
+import asyncio
+from algo.conflict_graph import ConflictGraph
+from utils.helpers import choice_from_url
+from utils.metrics import observe_stages
+
+class PlanningInput:
+    """
+    Module data for a single planning request.
+
+    The modules are fetched once in the normalized form stored at ingestion, which is already deduplicated, and the
+    full and filtered views the planner needs are derived lazily from that same in-memory data. The seconds spent in every stage are kept in timings.
+    """
+
+    def __init__(self, db, modules: list, semester: str, blocked_days: list, blocked_timings: dict):
+        self.db = db
+        self.modules = modules
+        self.semester = semester
+        self.blocked_days = blocked_days
+        self.blocked_timings = blocked_timings
+        self.timings = {}
+        self._normalized = None
+        self._distinct = None
+        self._filtered = None
+        self._equivalents = []
+        self._conflict_graph = None
+
+    def _timed(self, stage: str, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[stage] = time.perf_counter() - start
+        observe_stages({stage: self.timings[stage]})
+        return result
+
+    @property
+    def normalized(self) -> list:
+        """Normalized module info, in the order of modules."""
+        if self._normalized is None:
+            self._normalized = self._timed('fetch', self.db.draw_normalized_info, self.modules, self.semester)
+        return self._normalized
+
+    @property
+    def distinct(self) -> list:
+        """Module info without classes that are identical in time to another class of the same lesson type."""
+        if self._distinct is None:
+            self._distinct = self._timed('dedup', lambda: [module['classes'] for module in self.normalized])
+            self._equivalents = [module['equivalents'] for module in self.normalized]
+        return self._distinct
+
+    @property
+    def equivalents(self) -> list:
+        """Per module {class_type: {kept class_no: [interchangeable class_nos]}} for the classes dropped as duplicates."""
+        self.distinct
+        return self._equivalents
+
+    @property
+    def filtered(self) -> list:
+        """Distinct module info without classes on blocked days or timings."""
+        if self._filtered is None:
+            self._filtered = self._timed('filter', self.db.filter_module_info, self.distinct, self.blocked_days, self.blocked_timings)
+        return self._filtered
+
+    @property
+    def expected_cost(self) -> float:
+        """Rough solving effort, the module count plus log2 of the number of ways to pick a class of every lesson type."""
+        return len(self.modules) + sum(math.log2(count) for module in self.normalized if module is not None
+                                       for count in module['option_counts'].values() if count)
+
+    @property
+    def conflict_graph(self) -> ConflictGraph:
+        """Conflict graph of the distinct module info."""
+        if self._conflict_graph is None:
+            self._conflict_graph = self._timed('graph', ConflictGraph, self.distinct)
+        return self._conflict_graph
+
+    def with_constraints(self, blocked_days: list, blocked_timings: dict) -> 'PlanningInput':
+        """Input for the same modules under other blocked days and timings, sharing everything that does not depend on them."""
+        planning_input = PlanningInput(self.db, self.modules, self.semester, blocked_days, blocked_timings)
+        planning_input._normalized = self._normalized
+        planning_input._distinct = self._distinct
+        planning_input._equivalents = self._equivalents
+        planning_input._conflict_graph = self._conflict_graph
+        return planning_input
+
+    def load(self) -> 'PlanningInput':
+        """Runs every stage up front, e.g. from a worker thread before handing the views to the planner."""
+        self.filtered
+        return self
+
+    def planner_args(self, max_hours: int, blocked_out_time: dict) -> tuple:
+        """Positional arguments for ModPlanner."""
+        return (self.modules, self.distinct, self.semester, max_hours, blocked_out_time, self.filtered)
+
+    def planner_kwargs(self) -> dict:
+        """Keyword arguments for ModPlanner."""
+        planner_kwargs = {'equivalent_classes': self.equivalents}
+        if self._conflict_graph is not None:
+            planner_kwargs['conflict_graph'] = self._conflict_graph
+        return planner_kwargs
+
+class SpeculativePlan:
+    """
+    Work started for a module list while the user is still entering their constraints.
+
+    The module data is fetched and its conflict graph built right away, then solve(planning_input) is run in the
+    background for a timetable without constraints. The final request for the same modules reuses the prepared input
+    and takes that timetable as a hint for its own search.
+    """
+
+    def __init__(self, db, modules: list, semester: str, solve):
+        self.modules = list(modules)
+        self.semester = semester
+        self.planning_input = PlanningInput(db, self.modules, semester, [], {})
+        self.task = asyncio.create_task(self._run(solve))
+
+    def _prepare(self) -> None:
+        self.planning_input.load()
+        self.planning_input.conflict_graph
+
+    async def _run(self, solve):
+        await asyncio.to_thread(self._prepare)
+        return await solve(self.planning_input)
+
+    def matches(self, modules: list, semester: str) -> bool:
+        return self.modules == list(modules) and self.semester == semester
+
+    def hint(self) -> dict:
+        """Class choice of the speculative timetable, or None when it has not been found."""
+        if not self.task.done() or self.task.cancelled() or self.task.exception() is not None:
+            return None
+        solution = self.task.result()
+        if not solution or not solution[0] or solution[2]:
+            return None
+        return choice_from_url(self.modules, solution[0])
+
+    def cancel(self) -> None:
+        self.task.cancel()
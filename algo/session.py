@@ -0,0 +1,97 @@
+import numpy as np
+from collections import defaultdict
+from ortools.sat.python import cp_model
+from algo.conflict_graph import ConflictGraph
+from utils.schedule import ScheduleData, BlockedTimes
+from utils.helpers import day_to_int
+
+class PlanningSession:
+    """
+    Hard CP-SAT model of a module list that is kept while the user edits their constraints.
+
+    The model is built once over all distinct classes. Every blocked day, blocked timing and daily hours limit the user
+    asks for is added as an enforcement literal the first time it appears, and a solve only turns the literals of the
+    current constraints on as assumptions. Re-planning after an edit therefore reuses the model.
+    """
+
+    def __init__(self, modules: list, semester: str, mod_info: list, conflict_graph: ConflictGraph = None):
+        self.modules = list(modules)
+        self.semester = semester
+        schedule = conflict_graph.schedule if conflict_graph is not None else ScheduleData.coerce(mod_info)
+        conflict_graph = conflict_graph or ConflictGraph(schedule)
+        self.model = cp_model.CpModel()
+        # (module_idx, class_type, class_no) -> presence, in the order of the schedule's classes
+        self.presences = {}
+        class_presences = []
+        for module_idx, type_idx, class_no in zip(schedule.class_module.tolist(), schedule.class_type.tolist(), schedule.class_nos):
+            class_type = schedule.type_names[type_idx]
+            presence_var = self.model.NewBoolVar(f'presence_{self.modules[module_idx]}_{class_type}_{class_no}')
+            self.presences[(module_idx, class_type, class_no)] = presence_var
+            class_presences.append(presence_var)
+
+        type_offsets = schedule.type_offsets.tolist()
+        for type_idx in range(len(schedule.type_names)):
+            self.model.Add(sum(class_presences[type_offsets[type_idx]:type_offsets[type_idx + 1]]) == 1)
+        for clique in conflict_graph.clique_options():
+            self.model.AddAtMostOne(self.presences[option] for option in clique)
+
+        self.class_presences = class_presences
+        self.n_classes = len(schedule.class_nos)
+        self.class_idx, self.day, self.start, self.end = schedule.class_idx, schedule.day, schedule.start, schedule.end
+        self.day_lessons = defaultdict(list)
+        for class_idx, day, start_time, end_time in zip(schedule.class_idx.tolist(), schedule.day.tolist(), schedule.start.tolist(), schedule.end.tolist()):
+            self.day_lessons[day].append((class_presences[class_idx], end_time - start_time))
+
+        # Constraint key -> enforcement literal
+        self.literals = {}
+        self.active = []
+
+    def matches(self, modules: list, semester: str) -> bool:
+        return self.modules == list(modules) and self.semester == semester
+
+    def _block_literal(self, key: tuple, blocked_times: BlockedTimes):
+        literal = self.literals.get(key)
+        if literal is None:
+            literal = self.literals[key] = self.model.NewBoolVar(f'assume_{key}')
+            lesson_blocked = blocked_times.lessons_blocked(self.day, self.start, self.end)
+            class_blocked = np.bincount(self.class_idx, weights=lesson_blocked, minlength=self.n_classes) > 0
+            for class_idx in np.flatnonzero(class_blocked).tolist():
+                self.model.AddImplication(literal, self.class_presences[class_idx].Not())
+        return literal
+
+    def _hours_literal(self, day: int, max_mins: int):
+        key = ('max_mins', day, max_mins)
+        literal = self.literals.get(key)
+        if literal is None:
+            literal = self.literals[key] = self.model.NewBoolVar(f'assume_{key}')
+            self.model.Add(sum(duration * presence for presence, duration in self.day_lessons[day]) <= max_mins).OnlyEnforceIf(literal)
+        return literal
+
+    def constrain(self, blocked_days: list, timings: dict, max_hours: int, filtered_info) -> 'PlanningSession':
+        """
+        Sets the constraints of the next solve, with blocked days and timings as passed to DBClient.filter_module_info
+        and filtered_info the classes left by that filter.
+        """
+        self.active = []
+        for day in blocked_days:
+            self.active.append(self._block_literal(('day', day), BlockedTimes([day], {})))
+        for day_name in timings:
+            day = day_to_int(day_name)
+            for timing in timings[day_name]:
+                self.active.append(self._block_literal(('block', day, timing), BlockedTimes([], {day: [timing]})))
+        # Same as ModPlanner, which only limits days with more than one lesson left after filtering
+        lessons_per_day = np.bincount(ScheduleData.coerce(filtered_info).day, minlength=8)
+        for day in np.flatnonzero(lessons_per_day > 1).tolist():
+            self.active.append(self._hours_literal(day, max_hours * 60))
+        return self
+
+    def prepare_model(self, hint: dict) -> cp_model.CpModel:
+        """The model with the current constraints as assumptions and hint as solution hint."""
+        self.model.ClearAssumptions()
+        self.model.AddAssumptions(self.active)
+        self.model.ClearHints()
+        for (module_idx, class_type, class_no), presence_var in self.presences.items():
+            hinted_class_no = hint.get((module_idx, class_type))
+            if hinted_class_no is not None:
+                self.model.AddHint(presence_var, hinted_class_no == class_no)
+        return self.model
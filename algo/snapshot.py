@@ -0,0 +1,201 @@
+import os
+import mmap
+import struct
+import numpy as np
+from algo.db import CatalogClient, _MISSING
+from utils.helpers import parse_time, format_time, class_signature
+from utils.schedule import ScheduleData
+from utils.clashes import Clash, module_clashes
+
+SNAPSHOT_MAGIC = b'PBLSNAP\0'
+SNAPSHOT_FORMAT = 2
+
+# magic, format, catalog version, strings, string bytes, modules, semester entries, classes, lessons
+_HEADER = struct.Struct('<8sIqIIIIII')
+_MODULE = np.dtype([('mod_id', '<u4'), ('mod_name', '<u4'), ('first_entry', '<u4'), ('n_entries', '<u4')])
+_ENTRY = np.dtype([('semester', '<u4'), ('first_class', '<u4'), ('n_classes', '<u4')])
+# kept: index of the first class of the same lesson type with identical lesson times, the class itself if there is none
+_CLASS = np.dtype([('lesson_type', '<u4'), ('class_no', '<u4'), ('first_lesson', '<u4'), ('n_lessons', '<u4'), ('kept', '<u4')])
+_LESSON = np.dtype([('day', '<u2'), ('start', '<u2'), ('end', '<u2')])
+
+def _padded(data: bytes) -> bytes:
+    # Sections start on 8-byte boundaries
+    return data + b'\0' * (-len(data) % 8)
+
+def write_snapshot(path: str, docs, catalog_version: int) -> None:
+    """
+    Writes module documents to a binary catalog snapshot at path.
+
+    The file is a header followed by a string table and one fixed-size record array per level of the catalog:
+    modules, their semesters, classes and lessons. Every level points into the next with a (first, count) range.
+    Classes are deduplicated here, once, so that readers get the normalized form without comparing lessons.
+    """
+    strings = {}
+    def string_idx(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    modules, entries, classes, lessons = [], [], [], []
+    for doc in docs:
+        modules.append((string_idx(doc['mod_id']), string_idx(doc.get('mod_name', '')), len(entries), len(doc['semester_data'])))
+        for semester, semester_data in doc['semester_data'].items():
+            n_classes = sum(len(class_groups) for class_groups in semester_data.values())
+            entries.append((string_idx(semester), len(classes), n_classes))
+            for lesson_type, class_groups in semester_data.items():
+                # signature -> index of the first class with those lesson times
+                kept = {}
+                for class_no, class_list in class_groups.items():
+                    kept_idx = kept.setdefault(class_signature(class_list), len(classes))
+                    classes.append((string_idx(lesson_type), string_idx(class_no), len(lessons), len(class_list), kept_idx))
+                    for lesson in class_list:
+                        lessons.append((lesson['day'], parse_time(lesson['start_time']), parse_time(lesson['end_time'])))
+
+    encoded = [value.encode() for value in strings]
+    string_offsets = np.cumsum([0] + [len(value) for value in encoded], dtype='<u4')
+    blob = b''.join(encoded)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, catalog_version, len(encoded), len(blob),
+                          len(modules), len(entries), len(classes), len(lessons))
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_padded(header))
+        f.write(_padded(string_offsets.tobytes()))
+        f.write(_padded(blob))
+        for records, dtype in ((modules, _MODULE), (entries, _ENTRY), (classes, _CLASS), (lessons, _LESSON)):
+            f.write(_padded(np.array(records, dtype=dtype).tobytes()))
+    # Readers that already mapped the old file keep their pages, new readers see the new one
+    os.replace(tmp_path, path)
+
+class Snapshot:
+    """Read-only view of a snapshot file. The file is memory-mapped, so its pages are shared by every process reading it."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, file_format, self.catalog_version, n_strings, blob_len,
+         n_modules, n_entries, n_classes, n_lessons) = _HEADER.unpack_from(self._mmap)
+        if magic != SNAPSHOT_MAGIC or file_format != SNAPSHOT_FORMAT:
+            raise ValueError(f'{path} is not a format {SNAPSHOT_FORMAT} catalog snapshot')
+
+        offset = _HEADER.size + (-_HEADER.size % 8)
+        self.string_offsets, offset = self._array('<u4', n_strings + 1, offset)
+        self.blob_start = offset
+        offset += blob_len + (-blob_len % 8)
+        self.modules, offset = self._array(_MODULE, n_modules, offset)
+        self.entries, offset = self._array(_ENTRY, n_entries, offset)
+        self.classes, offset = self._array(_CLASS, n_classes, offset)
+        self.lessons, offset = self._array(_LESSON, n_lessons, offset)
+
+        self._strings = {}
+        self.module_index = {self.string(int(mod_id)): idx for idx, mod_id in enumerate(self.modules['mod_id'])}
+
+    def _array(self, dtype, count: int, offset: int) -> tuple:
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+        return array, offset + array.nbytes + (-array.nbytes % 8)
+
+    def string(self, idx: int) -> str:
+        value = self._strings.get(idx)
+        if value is None:
+            start = self.blob_start + int(self.string_offsets[idx])
+            end = self.blob_start + int(self.string_offsets[idx + 1])
+            value = self._strings[idx] = self._mmap[start:end].decode()
+        return value
+
+    def _classes(self, mod_id: str, semester: str):
+        """Range of the class records of a module in a semester, or None when it is not offered in the semester."""
+        module_idx = self.module_index.get(mod_id)
+        if module_idx is None:
+            return None
+        module = self.modules[module_idx]
+        for entry in self.entries[module['first_entry']:module['first_entry'] + module['n_entries']]:
+            if self.string(int(entry['semester'])) == semester:
+                return range(int(entry['first_class']), int(entry['first_class'] + entry['n_classes']))
+        return None
+
+    def _lessons(self, class_idx: int, class_no: str, normalized: bool) -> list:
+        class_record = self.classes[class_idx]
+        lesson_records = self.lessons[class_record['first_lesson']:class_record['first_lesson'] + class_record['n_lessons']]
+        lessons = []
+        for day, start, end in lesson_records.tolist():
+            lesson = {'class_no': class_no, 'day': day, 'start_time': format_time(start), 'end_time': format_time(end)}
+            if normalized:
+                lesson['start_min'], lesson['end_min'] = start, end
+            lessons.append(lesson)
+        return lessons
+
+    def semester_data(self, mod_id: str, semester: str):
+        """Semester data of a module in the shape stored in Mongo, or None when it is not offered in the semester."""
+        class_range = self._classes(mod_id, semester)
+        if class_range is None:
+            return None
+        semester_data = {}
+        for class_idx in class_range:
+            class_record = self.classes[class_idx]
+            class_no = self.string(int(class_record['class_no']))
+            semester_data.setdefault(self.string(int(class_record['lesson_type'])), {})[class_no] = self._lessons(class_idx, class_no, False)
+        return semester_data
+
+    def normalized_data(self, mod_id: str, semester: str):
+        """
+        Normalized semester data of a module as normalize_semester_data returns it, or None when it is not offered in
+        the semester. Only the classes kept at export are read, with their lesson minutes taken from the file as is.
+        """
+        class_range = self._classes(mod_id, semester)
+        if class_range is None:
+            return None
+        normalized = {'classes': {}, 'equivalents': {}, 'option_counts': {}}
+        class_nos = {}
+        for class_idx in class_range:
+            class_record = self.classes[class_idx]
+            lesson_type = self.string(int(class_record['lesson_type']))
+            class_no = class_nos[class_idx] = self.string(int(class_record['class_no']))
+            classes = normalized['classes'].setdefault(lesson_type, {})
+            equivalents = normalized['equivalents'].setdefault(lesson_type, {})
+            kept_idx = int(class_record['kept'])
+            if kept_idx == class_idx:
+                classes[class_no] = self._lessons(class_idx, class_no, True)
+            else:
+                equivalents.setdefault(class_nos[kept_idx], [class_nos[kept_idx]]).append(class_no)
+        normalized['option_counts'] = {lesson_type: len(classes) for lesson_type, classes in normalized['classes'].items()}
+        return normalized
+
+class SnapshotClient(CatalogClient):
+    """
+    Catalog client that reads the catalog from a snapshot file instead of Mongo.
+
+    Snapshots are read-only, so there is nothing to ingest or refresh. Export a new snapshot with scripts/snapshot.py and
+    restart to pick up a refreshed catalog.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.snapshot = Snapshot(path)
+        self.logger.info(f'Loaded catalog version {self.snapshot.catalog_version} with {len(self.snapshot.modules)} modules from {path}')
+
+    def get_catalog_version(self) -> int:
+        return self.snapshot.catalog_version
+
+    def _load_semester_data(self, mod_ids: list, semester: str) -> dict:
+        return {mod_id: self.snapshot.semester_data(mod_id, semester) for mod_id in mod_ids}
+
+    def _load_normalized_data(self, mod_ids: list, semester: str) -> dict:
+        normalized_data = {}
+        for mod_id in mod_ids:
+            cached = self.catalog_cache.get(('normalized', mod_id, semester), _MISSING)
+            if cached is _MISSING:
+                cached = self.snapshot.normalized_data(mod_id, semester)
+                self.catalog_cache.set(('normalized', mod_id, semester), cached)
+            normalized_data[mod_id] = cached
+        return normalized_data
+
+    def get_module_clashes(self, mod_id: str, modules: list, semester: str) -> dict:
+        # There is no precomputed index in a snapshot, but a handful of modules is quick to check directly
+        normalized_data = self._load_normalized_data([mod_id] + modules, semester)
+        others = [module for module in modules if normalized_data[module] is not None]
+        if normalized_data[mod_id] is None or not others:
+            return {}
+        schedule = ScheduleData.from_mod_info([normalized_data[module]['classes'] for module in [mod_id] + others])
+        clashes = {}
+        for (i, j), pair_clashes in module_clashes(schedule, single_only=True).items():
+            if i == 0:
+                clashes[others[j - 1]] = [[overlap['module1'], overlap['module2']] for overlap in map(Clash.as_overlap, pair_clashes)]
+        return clashes
@@ -1,7 +1,10 @@
+import asyncio
 import logging
 import re
+import time
 
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -11,27 +14,53 @@ from telegram.ext import (
     filters,
     CallbackQueryHandler,
 )
-from utils.keys import BOT_API_KEY
+from utils.keys import (BOT_API_KEY, PLAN_CACHE_DIR, SNAPSHOT_PATH, SOLVER_PROCESSES, MAX_PENDING_JOBS, JOB_DEADLINE, MAX_QUEUED_JOBS,
+                        MAX_USER_JOBS, MAX_PLANNING_SESSIONS, PLANNING_SESSION_TTL, METRICS_PORT, LOG_LEVEL, LOG_FORMAT,
+                        PLANNER_LOG_LEVEL)
 from algo.db import DBClient
-from algo.mod_planner import ModPlanner
-from utils.helpers import user_days_to_array, int_to_days, blockout_timings_cleaner, blocktimings_printer, blocked_time_merge
+from algo.snapshot import SnapshotClient
+from algo.cache import SolutionCache, TTLCache
+from algo.pipeline import PlanningInput, SpeculativePlan
+from algo.jobs import PlannerPool, PlannerBusyError, PlanCancelledError, PlanStoppedError, PlanPreemptedError, UserBusyError, SingleFlight, JobScheduler
+from utils.helpers import user_days_to_array, int_to_days, blockout_timings_cleaner, blocktimings_printer, blocked_time_merge, choice_from_url
+from utils.logs import configure_logging
+from utils.metrics import REGISTRY, STAGE_SECONDS, start_metrics_server
 
 # Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
+configure_logging(LOG_LEVEL, LOG_FORMAT, PLANNER_LOG_LEVEL)
 # set higher logging level for httpx to avoid all GET and POST requests being logged
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
-db = DBClient()
+db = SnapshotClient(SNAPSHOT_PATH) if SNAPSHOT_PATH else DBClient()
+plan_cache = SolutionCache(cache_dir=PLAN_CACHE_DIR)
+db.on_refresh(plan_cache.clear)
+# user id -> (modules, semester, class choice) of their last timetable, the hint when they plan the same modules again
+previous_timetables = TTLCache(MAX_PLANNING_SESSIONS, PLANNING_SESSION_TTL)
+planner_pool = PlannerPool(SOLVER_PROCESSES, MAX_PENDING_JOBS, JOB_DEADLINE, MAX_PLANNING_SESSIONS, PLANNING_SESSION_TTL)
+plan_flights = SingleFlight()
+job_scheduler = JobScheduler(SOLVER_PROCESSES, MAX_QUEUED_JOBS, MAX_USER_JOBS)
+
+REQUEST_SECONDS = REGISTRY.histogram('planbetterlah_request_seconds', 'Seconds from Continue to the planned timetable, by where it came from.')
+REGISTRY.callback('planbetterlah_plan_cache_hits_total', 'Planning requests answered from the solution cache.', lambda: plan_cache.hits, 'counter')
+REGISTRY.callback('planbetterlah_plan_cache_misses_total', 'Planning requests not found in the solution cache.', lambda: plan_cache.misses, 'counter')
+REGISTRY.callback('planbetterlah_plan_merges_total', 'Planning requests that joined an identical plan already in flight.', lambda: plan_flights.merges, 'counter')
+REGISTRY.callback('planbetterlah_plans_in_flight', 'Distinct plans being computed.', lambda: len(plan_flights.flights))
+REGISTRY.callback('planbetterlah_queue_depth', 'Planning jobs waiting for a solver.', lambda: len(job_scheduler.queue))
+REGISTRY.callback('planbetterlah_running_jobs', 'Planning jobs holding a solver.', lambda: job_scheduler.running)
+REGISTRY.callback('planbetterlah_shed_jobs_total', 'Planning jobs turned away because the queue was full.', lambda: job_scheduler.shed, 'counter')
 
 #Milestone 3
 SEMESTER, MODS, DELETE, BLOCK_DAYS, CONFIRM_BLOCKDAYS, BLOCKOUT_TIMINGS, LIMIT_HOURS, FINISH = range(8)
 
 MAX_NO_OF_MODULES = 10
 
+# Minimum number of seconds between edits of the planning status message
+STATUS_UPDATE_INTERVAL = 1.0
+# Seconds a speculative solve may hold a solver before it is stopped
+SPECULATION_DEADLINE = 30.0
+
 # RETURN A URL
 sample_url = "https://nusmods.com/timetable/sem-2/share?CS2030S=LAB:14F,REC:15,LEC:2&CS2040S=TUT:32,LEC:2,REC:08&ES2660=SEC:G08&IS1128=LEC:1&MA1521=TUT:16,LEC:1"
 
@@ -104,7 +133,9 @@ async def mods(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         else:
             #check for valid mod
             semester = context.user_data["semester"]
-            if db.check_valid_mod(module, semester):
+            with STAGE_SECONDS.time(stage='db_validate'):
+                valid = await asyncio.to_thread(db.check_valid_mod, module, semester)
+            if valid:
                 if len(modules) >= MAX_NO_OF_MODULES:
                     await update.message.reply_text(
                         "Maximum number of modules allowed per semester reached. \n"
@@ -112,8 +143,13 @@ async def mods(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
                     )
                     return MODS
                 
+                with STAGE_SECONDS.time(stage='db_clashes'):
+                    clashes = await asyncio.to_thread(db.get_module_clashes, module, modules, semester)
                 modules.append(module)
+                stop_speculation(context)
                 logger.info("User %s is taking module: %s", user.first_name, module)
+                if clashes:
+                    await update.message.reply_text(clash_warning(module, clashes))
                 if len(modules) == MAX_NO_OF_MODULES:
                     await update.message.reply_text(
                         f"Got it! Current list of modules is: {modules}\n\n"
@@ -136,11 +172,71 @@ async def mods(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return MODS
 
 
+def clash_warning(module: str, clashes: dict) -> str:
+    """Warning for a module that can never be taken together with some of the chosen ones."""
+    warning = f"Heads up: {module} can never be taken together with {', '.join(clashes)}, as lessons that have no other timeslot clash:\n"
+    for other, lessons in clashes.items():
+        for lesson, other_lesson in lessons:
+            warning += f"- {module} {lesson} clashes with {other} {other_lesson}\n"
+    return warning + "\nYou can still keep both, but no timetable will fit them together. Send /delete to remove one of them."
+
+
+def start_speculation(context: ContextTypes.DEFAULT_TYPE, user) -> None:
+    """Starts planning the chosen modules without any constraints while the user is still entering them."""
+    modules = context.user_data.get('modules', [])
+    semester = context.user_data['semester']
+    speculation = context.user_data.get('speculation')
+    if speculation is not None and speculation.matches(modules, semester):
+        return
+    stop_speculation(context)
+    # Speculation only uses solvers that would otherwise sit idle
+    if not modules or not job_scheduler.has_free_slot:
+        return
+
+    async def solve(planning_input):
+        catalog_version = await asyncio.to_thread(db.get_catalog_version)
+        cache_key = plan_cache.make_key(semester, planning_input.modules, {}, 24, catalog_version)
+        solution = plan_cache.get(cache_key)
+        if solution is not None:
+            return solution
+        job_id = ('speculative', user.id)
+        planner_args = planning_input.planner_args(24, {})
+        try:
+            solution = await job_scheduler.run(
+                job_id, planning_input.expected_cost,
+                lambda: planner_pool.submit(job_id, planner_args, planner_kwargs=planning_input.planner_kwargs(), deadline=SPECULATION_DEADLINE),
+                # Gives its solver up as soon as a real request would have to wait for one
+                preemptible=True,
+            )
+        except PlanPreemptedError:
+            logger.info("Speculative planning for User %s gave its solver up to a queued request", user.first_name)
+            return None
+        except (UserBusyError, PlannerBusyError, PlanCancelledError, asyncio.TimeoutError):
+            return None
+        except PlanStoppedError as e:
+            # Still good enough as a hint, but never cached
+            logger.info("Speculative planning for User %s stopped at its deadline", user.first_name)
+            return e.result
+        logger.info("Speculative timetable for User %s ready: %s", user.first_name, solution[0])
+        # Without constraints the first timetable found is final, a relaxed one may not be
+        if solution[0] and not solution[1] and not solution[2]:
+            plan_cache.set(cache_key, solution)
+        return solution
+
+    context.user_data['speculation'] = SpeculativePlan(db, modules, semester, solve)
+    logger.info("Started speculative planning for User %s: %s", user.first_name, modules)
+
+def stop_speculation(context: ContextTypes.DEFAULT_TYPE) -> None:
+    speculation = context.user_data.pop('speculation', None)
+    if speculation is not None:
+        speculation.cancel()
+
 async def done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Collects all the modules to generate URL"""
     user = update.message.from_user
     logger.info("User %s has completed the module input.", user.first_name)
     modules = context.user_data['modules']
+    start_speculation(context, user)
     if len(modules) == MAX_NO_OF_MODULES:
             await update.message.reply_text(
         f"Great! Here is the list of modules you've entered: {modules}\n\n"
@@ -196,6 +292,7 @@ async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if selected_module in modules:
         modules.remove(selected_module)
+        stop_speculation(context)
         await update.message.reply_text(
             f"Module '{selected_module}' has been deleted. Current list of modules is: {context.user_data['modules']}\n\n"
             "Please continue adding more modules or send /done to manage your current selection of modules."
@@ -218,7 +315,8 @@ async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             "No modules have been added. Please add some modules first."
         )
         return MODS
-    
+
+    start_speculation(context, user)
     await update.message.reply_text(
         "Please indicate the specific days you wish to exclude from your timetable planning. Use numbers to denote each day, starting with Monday as 1 (eg. '1, 2, 3') \n\n"
         "If you do not have any particular preferences, please click 'Skip'.\n\n"
@@ -432,6 +530,64 @@ async def limit_hours(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         await update.message.reply_text("Invalid input received. Please ensure that the number entered is between 2 and 24 inclusive without any extra symbols or letters.")
         return LIMIT_HOURS
 
+class PlanningStatus:
+    """Keeps a single chat message updated with the best timetable found so far while the planner is running."""
+
+    def __init__(self, message, loop):
+        self.message = message
+        self.loop = loop
+        self.start_time = time.monotonic()
+        self.last_update = None
+        # Edits started on the event loop, referenced until they finish
+        self.edits = set()
+
+    def on_progress(self, event: str, *args) -> None:
+        """Called with ('queued', position) while the job waits for a solver, and ('solution', url, violation_info) while it runs."""
+        if event == 'queued':
+            self.on_queued(*args)
+        else:
+            self.on_solution(*args)
+
+    def on_queued(self, position: int) -> None:
+        if position:
+            text = f"Many timetables are being planned right now. Your request is number {position} in the queue, please wait..."
+        else:
+            text = "Planning your timetable, this may take a while..."
+        self._schedule_edit(text)
+
+    def on_solution(self, url: str, violation_info: str) -> None:
+        """Called for every improving timetable reported by the planner."""
+        now = time.monotonic()
+        if self.last_update is not None and now - self.last_update < STATUS_UPDATE_INTERVAL:
+            return
+        self.last_update = now
+
+        elapsed = now - self.start_time
+        if violation_info:
+            text = f"Still searching for a better timetable ({elapsed:.1f}s). Best timetable so far, with some constraints relaxed:\n{url}"
+        else:
+            text = f"Found a timetable after {elapsed:.1f}s:\n{url}"
+        self._schedule_edit(text)
+
+    def _schedule_edit(self, text: str) -> None:
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            task = self.loop.create_task(self._edit(text))
+            self.edits.add(task)
+            task.add_done_callback(self.edits.discard)
+        else:
+            # Called from a worker thread
+            asyncio.run_coroutine_threadsafe(self._edit(text), self.loop)
+
+    async def _edit(self, text: str) -> None:
+        try:
+            await self.message.edit_text(text)
+        except TelegramError as e:
+            logger.warning("Unable to update planning status: %s", e)
+
 async def finish(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user = update.message.from_user
     message = update.message.text.strip()
@@ -473,15 +629,99 @@ async def finish(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         string_max_hours = f"Limit on total number of lesson hours per day: {max_hours}"
     
     blocked_out_time = blocked_time_merge(blocked_out_days, blocked_out_timings)
-    filtered_module_info = db.draw_filtered_module_info(modules, semester, blocked_out_days, blocked_out_timings)
-    module_info = db.draw_distinct_info(modules, semester)
-    logger.info("Finding timetable with the following information:")
-    logger.info(f"modules: {modules}")
-    logger.info(f"semester: {semester}")
-    logger.info(f"max_hours: {max_hours}")
-    logger.info(f"blocked_out_time: {blocked_out_time}")
-    planner = ModPlanner(modules, module_info, semester, max_hours, blocked_out_time, filtered_module_info)
-    solution = planner.solve()
+    speculation = context.user_data.pop('speculation', None)
+    planning_input = PlanningInput(db, modules, semester, blocked_out_days, blocked_out_timings)
+    hint = None
+    if speculation is not None:
+        if speculation.matches(modules, semester):
+            # The module data and conflict graph were prepared while the user entered their constraints
+            planning_input = speculation.planning_input.with_constraints(blocked_out_days, blocked_out_timings)
+            hint = speculation.hint()
+        # A speculative solve that is still running would only hold up a solver
+        speculation.cancel()
+    request_start = time.monotonic()
+    catalog_version = await asyncio.to_thread(db.get_catalog_version)
+    cache_key = plan_cache.make_key(semester, modules, blocked_out_time, max_hours, catalog_version)
+    solution = plan_cache.get(cache_key)
+    if solution is not None:
+        logger.info("Using cached timetable for modules: %s", modules)
+        REQUEST_SECONDS.observe(time.monotonic() - request_start, source='cache')
+    else:
+        status_message = await update.message.reply_text("Planning your timetable, this may take a while...")
+        status = PlanningStatus(status_message, asyncio.get_running_loop())
+
+        async def plan(notify):
+            await asyncio.to_thread(planning_input.load)
+            previous = previous_timetables.get(user.id)
+            previous_hint = previous[2] if previous is not None and previous[:2] == (tuple(modules), semester) else None
+            logger.info("Module data prepared in: %s", {stage: f"{seconds:.3f}s" for stage, seconds in planning_input.timings.items()})
+            logger.info("Finding timetable with the following information:")
+            logger.info(f"modules: {modules}")
+            logger.info(f"semester: {semester}")
+            logger.info(f"max_hours: {max_hours}")
+            logger.info(f"blocked_out_time: {blocked_out_time}")
+            logger.info(f"hint: {'previous timetable' if previous_hint else 'speculative timetable' if hint else 'none'}")
+            planner_args = planning_input.planner_args(max_hours, blocked_out_time)
+            planner_kwargs = planning_input.planner_kwargs()
+            # The worker that runs the job keeps the user's CP-SAT model, and builds it only if the fast path fails.
+            # Keyed on the catalog version too, as the model depends on the module data
+            planner_kwargs['session_key'] = (user.id, catalog_version)
+            planner_kwargs['session_constraints'] = (blocked_out_days, blocked_out_timings)
+            planner_kwargs['hint'] = previous_hint or hint
+            on_solution = lambda url, violation_info: notify('solution', url, violation_info)
+            try:
+                solution = await job_scheduler.run(
+                    user.id, planning_input.expected_cost,
+                    lambda: planner_pool.submit(cache_key, planner_args, on_solution, planner_kwargs),
+                    lambda position: notify('queued', position),
+                )
+            except PlanStoppedError as e:
+                # Shown to the user, but not cached, as a full solve may still do better
+                solution = e.result
+            else:
+                plan_cache.set(cache_key, solution)
+            if solution[0] and not solution[2]:
+                previous_timetables.set(user.id, (tuple(modules), semester, choice_from_url(modules, solution[0])))
+            return solution
+
+        # Identical requests that arrive while this one is planned share its solve
+        context.user_data['planning_task'] = asyncio.current_task()
+        try:
+            solution = await plan_flights.run(cache_key, plan, status.on_progress)
+        except UserBusyError:
+            logger.info("User %s already has a timetable being planned.", user.first_name)
+            await update.message.reply_text(
+                "You already have a timetable being planned. Please wait for it to finish, then click 'Continue' again.",
+                reply_markup=ReplyKeyboardMarkup([["Continue", "Edit"]], one_time_keyboard=True, resize_keyboard=True)
+            )
+            return FINISH
+        except PlannerBusyError:
+            logger.info("Planning queue is full, turning away User %s.", user.first_name)
+            await update.message.reply_text(
+                "Sorry, the planning queue is full right now, so we could not accept your request. "
+                "Please click 'Continue' again in a few minutes.",
+                reply_markup=ReplyKeyboardMarkup([["Continue", "Edit"]], one_time_keyboard=True, resize_keyboard=True)
+            )
+            return FINISH
+        except PlanCancelledError:
+            logger.info("Planning for User %s has been cancelled.", user.first_name)
+            return ConversationHandler.END
+        except asyncio.CancelledError:
+            # Sent /cancel, whose handler ends the conversation
+            logger.info("Planning for User %s has been cancelled.", user.first_name)
+            raise
+        except asyncio.TimeoutError:
+            logger.info("Planning for User %s did not finish in time.", user.first_name)
+            await update.message.reply_text(
+                "Sorry, we were unable to plan your timetable in time. Please try again with fewer modules or constraints.\n\n"
+                "Thank you for using PlanBetterLah!",
+                reply_markup=ReplyKeyboardRemove(),
+            )
+            return ConversationHandler.END
+        finally:
+            context.user_data.pop('planning_task', None)
+        REQUEST_SECONDS.observe(time.monotonic() - request_start, source='planner')
+    logger.info("Plan cache hits: %d, misses: %d, requests merged into a running plan: %d", plan_cache.hits, plan_cache.misses, plan_flights.merges)
     url = solution[0]
     violation_info = solution[1]
     error_message = solution[2]
@@ -556,6 +796,12 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancels and ends the conversation."""
     user = update.message.from_user
     logger.info("User %s canceled the conversation.", user.first_name)
+    stop_speculation(context)
+    planning_task = context.user_data.pop('planning_task', None)
+    if planning_task is not None:
+        # The shared planning job itself only stops once no other user is waiting for it
+        planning_task.cancel()
+        logger.info("Stopped waiting for the timetable of User %s.", user.first_name)
     await update.message.reply_text(
         "Bye! Thank you for using PlanBetterLah!", reply_markup=ReplyKeyboardRemove()
     )
@@ -564,8 +810,13 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 def main() -> None:
     """Run the bot."""
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", METRICS_PORT)
+
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(BOT_API_KEY).build()
+    # Updates are handled concurrently, so that one user's planning job never holds up everyone else
+    application = Application.builder().token(BOT_API_KEY).concurrent_updates(True).build()
 
     # Add conversation handler with the states MODS
     conv_handler = ConversationHandler(
@@ -587,6 +838,7 @@ def main() -> None:
 
     # Run the bot until the user presses Ctrl-C
     application.run_polling(allowed_updates=Update.ALL_TYPES)
+    planner_pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import random
+import time
+from algo.db import DBClient
+from utils.helpers import check_block_timings
+from utils.schedule import ScheduleData
+from utils.clashes import overlapping_pairs, module_clashes
+
+def load_catalog(path: str, semester: str) -> list:
+    """Semester data of every module in a JSON array export of the module_info collection."""
+    with open(path, 'r') as f:
+        docs = json.load(f)
+    return [doc['semester_data'][semester] for doc in docs if semester in doc.get('semester_data', {})]
+
+def synthetic_catalog(n_modules: int, seed: int = 0) -> list:
+    """Catalog shaped like NUSMods data, with large tutorial groups where many classes share the same times."""
+    rng = random.Random(seed)
+    catalog = []
+    for _ in range(n_modules):
+        module = {}
+        for lesson_type, n_classes in (('LEC', rng.randint(1, 3)), ('TUT', rng.randint(1, 60)), ('LAB', rng.randint(0, 20))):
+            classes = {}
+            for class_no in range(n_classes):
+                day = rng.randint(1, 5)
+                start = rng.randint(8, 18)
+                classes[f'{class_no:02d}'] = [{
+                    'class_no': f'{class_no:02d}',
+                    'day': day,
+                    'start_time': f'{start:02d}00',
+                    'end_time': f'{start + rng.randint(1, 2):02d}00',
+                }]
+            if classes:
+                module[lesson_type] = classes
+        catalog.append(module)
+    return catalog
+
+def timed(func, *args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_dedup(catalog: list) -> None:
+    # The dedup step does not touch the database, so no connection is needed
+    client = DBClient.__new__(DBClient)
+    n_classes = sum(len(classes) for module in catalog for classes in module.values())
+    seconds = timed(client.distinct_module_info, catalog)
+    print(f'dedup: {len(catalog)} modules, {n_classes} classes in {seconds * 1000:.1f} ms')
+
+# Every 1-hour button of the bot's blockout keyboard, Monday to Saturday
+KEYBOARD_TIMESLOTS = [f'{hour:02d}00-{hour + 1:02d}00' for hour in range(8, 21)]
+
+def filter_per_lesson(mod_info: list, blocked_days: list, blocked_timings: dict) -> list:
+    """The nested-loop filter that checks every lesson against every block, kept as the baseline."""
+    filtered_mod_info = []
+    for mod in mod_info:
+        filtered_info = {}
+        for lesson_type, class_info in mod.items():
+            filtered_info[lesson_type] = {lesson_no: lesson_info for lesson_no, lesson_info in class_info.items()
+                                          if not any(item['day'] in blocked_days or check_block_timings(item, blocked_timings) for item in lesson_info)}
+        filtered_mod_info.append(filtered_info)
+    return filtered_mod_info
+
+def bench_filter(catalog: list, n_modules: int = 10) -> None:
+    client = DBClient.__new__(DBClient)
+    mod_info = client.distinct_module_info(catalog[:n_modules])
+    n_classes = sum(len(classes) for module in mod_info for classes in module.values())
+    blocked_timings = {day: list(KEYBOARD_TIMESLOTS) for day in range(1, 7)}
+    assert client.module_days_filtered(mod_info, [], blocked_timings) == filter_per_lesson(mod_info, [], blocked_timings)
+
+    schedule = ScheduleData.from_mod_info(mod_info)
+    for name, func, info in (('per lesson', filter_per_lesson, mod_info), ('bitmask', client.module_days_filtered, mod_info),
+                             ('bitmask on ScheduleData', client.module_days_filtered, schedule)):
+        seconds = timed(func, info, [], blocked_timings, repeat=20)
+        print(f'filter ({name}): {n_modules} modules, {n_classes} classes, fully ticked keyboard in {seconds * 1000:.2f} ms')
+
+def bench_clashes(catalog: list) -> None:
+    schedule = ScheduleData.from_mod_info(catalog)
+    start = time.perf_counter()
+    n_pairs = sum(len(rows1) for rows1, _ in overlapping_pairs(schedule.day, schedule.start, schedule.end))
+    print(f'overlapping lesson pairs: {len(catalog)} modules, {len(schedule)} lessons, {n_pairs} pairs in {time.perf_counter() - start:.2f} s')
+
+    start = time.perf_counter()
+    clashes = module_clashes(schedule, single_only=True)
+    n_clashes = sum(len(pair_clashes) for pair_clashes in clashes.values())
+    print(f'single-option clashes: {len(clashes)} module pairs, {n_clashes} clashes in {time.perf_counter() - start:.2f} s')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the planning pipeline')
+    parser.add_argument('benchmark', choices=['dedup', 'filter', 'clashes'])
+    parser.add_argument('--catalog', help='JSON array export of the module_info collection, synthetic data if omitted')
+    parser.add_argument('--semester', default='1')
+    parser.add_argument('--modules', type=int, default=6000, help='number of synthetic modules')
+    args = parser.parse_args()
+
+    catalog = load_catalog(args.catalog, args.semester) if args.catalog else synthetic_catalog(args.modules)
+    if args.benchmark == 'dedup':
+        bench_dedup(catalog)
+    elif args.benchmark == 'filter':
+        bench_filter(catalog)
+    elif args.benchmark == 'clashes':
+        bench_clashes(catalog)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from algo.db import DBClient
+from algo.snapshot import write_snapshot
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Exports the module catalog from Mongo to a snapshot file')
+    parser.add_argument('path', help='file to write, e.g. the SNAPSHOT_PATH of the bot')
+    args = parser.parse_args()
+
+    client = DBClient()
+    version = client.get_catalog_version()
+    docs = client.collection.find({}, {'_id': 0, 'mod_id': 1, 'mod_name': 1, 'semester_data': 1})
+    write_snapshot(args.path, docs, version)
+    client.logger.info(f'Catalog version {version} written to {args.path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import pytest
+from algo import cache
+from algo.cache import TTLCache, SolutionCache
+
+TEST_RESULT = ('https://nusmods.com/timetable/sem-2/share?MA1521=TUT:5,LEC:2', '', '')
+
+def test_lru_eviction():
+    lru = TTLCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert len(lru) == 2
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    lru = TTLCache(ttl=10)
+    lru.set('a', 1)
+    now[0] += 9
+    assert lru.get('a') == 1
+    now[0] += 2
+    assert lru.get('a') is None
+
+def test_canonical_key():
+    key = SolutionCache.make_key('2', ['MA1521', 'CS1101S'], {1: [], 2: ['0800-0900']}, 24, 3)
+    assert key == SolutionCache.make_key('2', ['CS1101S', 'MA1521'], {2: ['0800-0900'], 3: []}, 24, 3)
+    assert key != SolutionCache.make_key('2', ['CS1101S', 'MA1521'], {2: ['0800-0900']}, 24, 4)
+    assert key != SolutionCache.make_key('1', ['CS1101S', 'MA1521'], {2: ['0800-0900']}, 24, 3)
+
+def test_disk_tier(tmp_path):
+    key = SolutionCache.make_key('2', ['MA1521'], {}, 24, 1)
+    SolutionCache(cache_dir=str(tmp_path)).set(key, TEST_RESULT)
+    solution_cache = SolutionCache(cache_dir=str(tmp_path))
+    assert solution_cache.get(key) == TEST_RESULT
+    solution_cache.clear()
+    assert SolutionCache(cache_dir=str(tmp_path)).get(key) is None
+
+def test_hit_counters():
+    key = SolutionCache.make_key('2', ['MA1521'], {}, 24, 1)
+    solution_cache = SolutionCache()
+    assert solution_cache.get(key) is None
+    solution_cache.set(key, TEST_RESULT)
+    assert solution_cache.get(key) == TEST_RESULT
+    assert (solution_cache.hits, solution_cache.misses) == (1, 1)
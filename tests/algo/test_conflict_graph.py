@@ -0,0 +1,32 @@
+import pytest
+from algo.conflict_graph import ConflictGraph
+
+def lesson(day, start_time, end_time):
+    return {'day': day, 'start_time': start_time, 'end_time': end_time}
+
+TEST_MOD_INFO = [
+    {'LEC': {'1': [lesson(1, '1000', '1200')]}, 'TUT': {'01': [lesson(1, '1100', '1200')], '02': [lesson(2, '1000', '1100')]}},
+    {'LEC': {'1': [lesson(1, '1100', '1300')]}},
+    {'LEC': {'1': [lesson(1, '1200', '1400')]}},
+]
+
+def test_cliques():
+    graph = ConflictGraph(TEST_MOD_INFO)
+    cliques = sorted(sorted(clique) for clique in graph.clique_options())
+    assert cliques == [
+        [(0, 'LEC', '1'), (0, 'TUT', '01'), (1, 'LEC', '1')],
+        [(1, 'LEC', '1'), (2, 'LEC', '1')],
+    ]
+
+def test_back_to_back_lessons_do_not_conflict():
+    graph = ConflictGraph(TEST_MOD_INFO)
+    assert graph.conflicts((0, 'LEC', '1')) == [(0, 'TUT', '01'), (1, 'LEC', '1')]
+    assert graph.conflicts((1, 'LEC', '1')) == [(0, 'LEC', '1'), (0, 'TUT', '01'), (2, 'LEC', '1')]
+    assert graph.conflicts((0, 'TUT', '02')) == []
+
+def test_module_clashes_single_only():
+    graph = ConflictGraph(TEST_MOD_INFO)
+    clashes = graph.module_clashes(single_only=True)
+    assert list(clashes.keys()) == [(0, 1), (1, 2)]
+    assert clashes[(0, 1)] == [{'module1': 'LEC[1] on Monday, 1000-1200', 'module2': 'LEC[1] on Monday, 1100-1300'}]
+    assert len(graph.module_clashes()[(0, 1)]) == 2
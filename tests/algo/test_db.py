@@ -1 +1,90 @@
-import pytest
\ No newline at end of file
+import pytest
+from algo import db as db_module
+from algo.db import DBClient, SCHEMA_VERSION
+from tests.fake_mongo import FakeMongoClient
+
+def lesson(class_no, day, start_time, end_time):
+    return {'class_no': class_no, 'day': day, 'start_time': start_time, 'end_time': end_time}
+
+TEST_MODULES = [
+    {'mod_id': 'CS1101S', 'mod_name': 'Programming Methodology', 'semester_data': {
+        '1': {'LEC': {'1': [lesson('1', 3, '1000', '1200')]}},
+        '2': {'LEC': {'1': [lesson('1', 3, '1200', '1400')]}},
+    }},
+    {'mod_id': 'MA1521', 'mod_name': 'Calculus for Computing', 'semester_data': {
+        '2': {'LEC': {'2': [lesson('2', 1, '1000', '1200')]}, 'TUT': {'5': [lesson('5', 2, '0900', '1000')], '6': [lesson('6', 2, '0900', '1000')]}},
+    }},
+]
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(db_module, 'MongoClient', FakeMongoClient)
+    client = DBClient()
+    client.collection.docs.extend(TEST_MODULES)
+    return client
+
+def test_check_valid_mod(client):
+    assert client.check_valid_mod('CS1101S', '1')
+    assert not client.check_valid_mod('MA1521', '1')
+    assert not client.check_valid_mod('XX0000', '2')
+
+def test_draw_module_info_batched_and_cached(client):
+    assert client.check_valid_mod('CS1101S', '2')
+    round_trips = client.collection.round_trips
+    mod_info = client.draw_module_info(['MA1521', 'CS1101S'], '2')
+    assert mod_info == [TEST_MODULES[1]['semester_data']['2'], TEST_MODULES[0]['semester_data']['2']]
+    # CS1101S is cached from validation, so only MA1521 is fetched
+    assert client.collection.round_trips == round_trips + 1
+    client.draw_module_info(['MA1521', 'CS1101S'], '2')
+    assert client.collection.round_trips == round_trips + 1
+
+def test_catalog_version_invalidates_cache(client, monkeypatch):
+    monkeypatch.setattr(db_module, 'VERSION_CHECK_INTERVAL', 0)
+    assert client.get_mod_info('CS1101S', '1') == TEST_MODULES[0]['semester_data']['1']
+    client.collection.docs[0] = {'mod_id': 'CS1101S', 'semester_data': {'1': {}}}
+    assert client.get_mod_info('CS1101S', '1') == TEST_MODULES[0]['semester_data']['1']
+    client.meta_collection.find_one_and_update({'_id': 'module_info'}, {'$inc': {'version': 1}}, upsert=True)
+    assert client.get_mod_info('CS1101S', '1') == {}
+
+def test_draw_distinct_info(client):
+    distinct_info = client.draw_distinct_info(['MA1521'], '2')
+    assert list(distinct_info[0]['TUT'].keys()) == ['5']
+
+def test_normalized_info_for_old_and_new_documents(client):
+    client.collection.docs.append({'mod_id': 'CS2030S', 'schema_version': SCHEMA_VERSION, 'normalized_data': {'2': {'classes': {}, 'equivalents': {}}}})
+    old_info, new_info = client.draw_normalized_info(['MA1521', 'CS2030S'], '2')
+    # Documents without a schema version are normalized when they are read
+    assert old_info['classes']['TUT'] == {'5': [dict(lesson('5', 2, '0900', '1000'), start_min=540, end_min=600)]}
+    assert old_info['equivalents']['TUT'] == {'5': ['5', '6']}
+    assert new_info == {'classes': {}, 'equivalents': {}}
+    assert client.draw_normalized_info(['CS1101S'], '2')[0]['option_counts'] == {'LEC': 1}
+
+def test_normalized_info_for_outdated_layout(client):
+    # Written by an earlier layout, so its normalized data is not used as is
+    stale = {'classes': {}, 'equivalents': {}, 'signatures': {}, 'masks': {}, 'option_counts': {}}
+    client.collection.docs.append({'mod_id': 'CS2030S', 'schema_version': SCHEMA_VERSION - 1, 'normalized_data': {'2': stale},
+                                   'semester_data': {'2': {'LEC': {'1': [lesson('1', 1, '1000', '1200')]}}}})
+    normalized = client.draw_normalized_info(['CS2030S'], '2')[0]
+    assert set(normalized) == {'classes', 'equivalents', 'option_counts'}
+    assert normalized['option_counts'] == {'LEC': 1}
+
+def test_clash_index(client):
+    client.collection.docs.append({'mod_id': 'CS2040S', 'semester_data': {'2': {
+        'LEC': {'1': [lesson('1', 3, '1300', '1500')]},
+        # Two options, so clashing with one of them can be avoided
+        'TUT': {'1': [lesson('1', 1, '1000', '1100')], '2': [lesson('2', 4, '1000', '1100')]},
+    }}})
+    client.rebuild_clash_index()
+    assert client.get_module_clashes('CS2040S', ['MA1521', 'CS1101S'], '2') == {
+        'CS1101S': [['LEC[1] on Wednesday, 1300-1500', 'LEC[1] on Wednesday, 1200-1400']],
+    }
+    assert client.get_module_clashes('CS1101S', ['CS2040S'], '2') == {
+        'CS2040S': [['LEC[1] on Wednesday, 1200-1400', 'LEC[1] on Wednesday, 1300-1500']],
+    }
+    assert client.get_module_clashes('MA1521', ['CS1101S', 'CS2040S'], '2') == {}
+
+    # Clashes that went away are dropped on the next rebuild
+    client.collection.docs.pop()
+    client.rebuild_clash_index()
+    client.catalog_cache.clear()
+    assert client.get_module_clashes('CS1101S', ['CS2040S'], '2') == {}
@@ -0,0 +1,37 @@
+import pytest
+import json
+import os
+from algo.fast_path import FastPathSolver
+
+def load_test_file(file_name):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'testcases', file_name), 'r') as f:
+        return json.load(f)
+
+def test_s2_5m_positive():
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    status, choice = FastPathSolver(test_mod_info, 24 * 60).solve()
+    assert status == FastPathSolver.FOUND
+    assert len(choice) == sum(len(module) for module in test_mod_info)
+
+def test_s1_8m_negative():
+    test_mod_info = load_test_file('s1_8m_negative.json')
+    status, choice = FastPathSolver(test_mod_info, 6 * 60).solve()
+    assert status == FastPathSolver.INFEASIBLE
+    assert choice == {}
+
+def test_max_hours():
+    lesson = lambda start_time, end_time: {'day': 1, 'start_time': start_time, 'end_time': end_time}
+    test_mod_info = [{'LEC': {'1': [lesson('0800', '1000')]}, 'TUT': {'1': [lesson('1000', '1200')]}}]
+    assert FastPathSolver(test_mod_info, 4 * 60).solve()[0] == FastPathSolver.FOUND
+    assert FastPathSolver(test_mod_info, 3 * 60).solve()[0] == FastPathSolver.INFEASIBLE
+
+def test_budget_exceeded():
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    status, _ = FastPathSolver(test_mod_info, 24 * 60, node_limit=1).solve()
+    assert status == FastPathSolver.UNKNOWN
+
+def test_hint():
+    lesson = lambda start_time, end_time: {'day': 1, 'start_time': start_time, 'end_time': end_time}
+    test_mod_info = [{'TUT': {'1': [lesson('0800', '0900')], '2': [lesson('0900', '1000')], '3': [lesson('1000', '1100')]}}]
+    assert FastPathSolver(test_mod_info, 24 * 60).solve()[1] == {(0, 'TUT'): '1'}
+    assert FastPathSolver(test_mod_info, 24 * 60, hint={(0, 'TUT'): '3'}).solve()[1] == {(0, 'TUT'): '3'}
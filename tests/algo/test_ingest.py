@@ -0,0 +1,89 @@
+import os
+import asyncio
+import threading
+import functools
+import pytest
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from algo import db as db_module
+from algo.db import DBClient
+from algo.ingest import CatalogIngestor, SCHEMA_VERSION
+from tests.fake_mongo import FakeCollection, FakeMongoClient
+
+RECORDED_DIR = os.path.join(os.path.dirname(__file__), '..', 'testcases', 'nusmods')
+
+class StubHandler(SimpleHTTPRequestHandler):
+    """Serves the recorded NUSMods JSON, failing the first requests of every path listed in server.flaky."""
+
+    def do_GET(self):
+        remaining = self.server.flaky.get(self.path, 0)
+        if remaining:
+            self.server.flaky[self.path] = remaining - 1
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(StubHandler, directory=RECORDED_DIR))
+    server.flaky = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def base_url(server):
+    return f'http://127.0.0.1:{server.server_address[1]}/%s.json'
+
+def test_ingest_catalog(stub_server):
+    collection = FakeCollection()
+    ingestor = CatalogIngestor(base_url(stub_server), collection, concurrency=2, batch_size=2, backoff=0)
+    stats = asyncio.run(ingestor.run())
+    assert (stats.total, stats.fetched, stats.written, stats.batches, stats.failed) == (3, 3, 3, 2, 0)
+
+    docs = {doc['mod_id']: doc for doc in collection.docs}
+    assert set(docs) == {'CS1101S', 'MA1521', 'ST2334'}
+    cs1101s = docs['CS1101S']
+    assert cs1101s['schema_version'] == SCHEMA_VERSION
+    assert [lesson['day'] for lesson in cs1101s['semester_data']['1']['LEC']['1']] == [3, 5]
+    assert cs1101s['normalized_data']['1']['equivalents']['REC'] == {'01A': ['01A', '01B']}
+
+    # Upserts replace the documents of a second run instead of duplicating them
+    asyncio.run(ingestor.run())
+    assert len(collection.docs) == 3
+
+def test_ingest_retries_and_skips(stub_server):
+    stub_server.flaky = {'/modules/MA1521.json': 2}
+    collection = FakeCollection()
+    ingestor = CatalogIngestor(base_url(stub_server), collection, concurrency=4, backoff=0)
+    stats = asyncio.run(ingestor.run(['MA1521', 'XX0000']))
+    assert stats.retries == 2
+    # Unknown modules are a permanent failure and are not retried
+    assert stats.failed == 1
+    assert [doc['mod_id'] for doc in collection.docs] == ['MA1521']
+
+def test_incremental_refresh(stub_server, monkeypatch):
+    monkeypatch.setattr(db_module, 'MongoClient', FakeMongoClient)
+    client = DBClient()
+    client.base_url = base_url(stub_server)
+    asyncio.run(CatalogIngestor(client.base_url, client.collection).run(['CS1101S', 'MA1521']))
+    docs = {doc['mod_id']: doc for doc in client.collection.docs}
+    # An outdated document, and one for a module that has left the catalog
+    docs['MA1521'].pop('content_hash')
+    client.collection.docs.append({'mod_id': 'XX9999', 'semester_data': {'1': {}}})
+    refreshed = []
+    client.on_refresh(lambda: refreshed.append(True))
+
+    client.refresh_module_info()
+    assert sorted(doc['mod_id'] for doc in client.collection.docs) == ['CS1101S', 'MA1521', 'ST2334']
+    assert 'content_hash' in {doc['mod_id']: doc for doc in client.collection.docs}['MA1521']
+    assert client.get_catalog_version() == 1
+    assert refreshed == [True]
+
+    # Nothing changed, so no new version is published
+    client.refresh_module_info()
+    assert client.get_catalog_version() == 1
+    assert refreshed == [True]
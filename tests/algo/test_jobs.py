@@ -0,0 +1,214 @@
+import pytest
+import json
+import os
+import asyncio
+import algo.jobs as jobs
+from algo.jobs import PlannerPool, PlannerBusyError, PlanCancelledError, PlanStoppedError, PlanPreemptedError, UserBusyError, SingleFlight, JobScheduler
+
+def load_test_file(file_name):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'testcases', file_name), 'r') as f:
+        return json.load(f)
+
+TEST_MODULES = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+TEST_BLOCKED_TIMINGS = {1: [], 2: [], 3: [], 4: [], 5: [], 6: []}
+
+def planner_args():
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    return (TEST_MODULES, test_mod_info, 2, 24, TEST_BLOCKED_TIMINGS, test_mod_info)
+
+def test_submit():
+    pool = PlannerPool(processes=1)
+    try:
+        (url, best_info, errormsg) = asyncio.run(pool.submit('user', planner_args(), lambda url, violation_info: None))
+    finally:
+        pool.shutdown()
+    assert url
+    assert pool.pending == 0
+    assert not pool.stop_events
+
+def test_busy():
+    pool = PlannerPool(processes=1, max_pending=0)
+    with pytest.raises(PlannerBusyError):
+        asyncio.run(pool.submit('user', planner_args()))
+
+def test_cancel():
+    pool = PlannerPool(processes=1)
+
+    async def run():
+        job = asyncio.create_task(pool.submit('user', planner_args()))
+        await asyncio.sleep(0)
+        assert pool.cancel('user')
+        return await job
+
+    try:
+        with pytest.raises(PlanCancelledError):
+            asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert not pool.cancel('user')
+
+def test_deadline_stops():
+    pool = PlannerPool(processes=1)
+    try:
+        # The worker process can not even start within the deadline
+        with pytest.raises(PlanStoppedError) as e:
+            asyncio.run(pool.submit('user', planner_args(), deadline=0.001))
+    finally:
+        pool.shutdown()
+    assert len(e.value.result) == 3
+    assert pool.pending == 0
+    assert not pool.stop_events
+
+def test_worker_sessions():
+    jobs._init_worker(4, 60)
+    try:
+        # The fast path settles the request, so no model is built
+        (url, _, _), timings, _ = jobs._plan(planner_args(), {'session_key': 'user', 'session_constraints': ([], {})}, 2, 60, None, None, None)
+        assert url and 'session' not in timings
+        assert jobs._sessions.get('user') is None
+
+        kwargs = {'fast_path': False, 'session_key': 'user', 'session_constraints': ([], {})}
+        (url, _, _), timings, _ = jobs._plan(planner_args(), kwargs, 2, 60, None, None, None)
+        session = jobs._sessions.get('user')
+        assert url and 'session' in timings and session is not None
+        kwargs['session_constraints'] = ([], {'Monday': ['0800-1000']})
+        (url, _, _), _, _ = jobs._plan(planner_args(), kwargs, 2, 60, None, None, None)
+        assert url and jobs._sessions.get('user') is session
+    finally:
+        jobs._sessions = None
+
+def test_single_flight_merges():
+    flights = SingleFlight()
+    started = []
+
+    async def plan(notify):
+        started.append(True)
+        notify('url1', 'info1')
+        await asyncio.sleep(0.01)
+        notify('url2', 'info2')
+        return 'solution'
+
+    async def run():
+        progress = [[], []]
+        first = asyncio.create_task(flights.run('key', plan, lambda *args: progress[0].append(args)))
+        await asyncio.sleep(0)
+        # The second caller joins late and gets the progress it missed
+        second = asyncio.create_task(flights.run('key', plan, lambda *args: progress[1].append(args)))
+        return await asyncio.gather(first, second), progress
+
+    results, progress = asyncio.run(run())
+    assert results == ['solution', 'solution']
+    assert started == [True]
+    assert progress == [[('url1', 'info1'), ('url2', 'info2')]] * 2
+    assert (flights.calls, flights.merges) == (2, 1)
+    assert not flights.flights
+
+def test_single_flight_cancel():
+    flights = SingleFlight()
+
+    async def plan(notify):
+        await asyncio.sleep(0.05)
+        return 'solution'
+
+    async def run():
+        first = asyncio.create_task(flights.run('key', plan))
+        second = asyncio.create_task(flights.run('key', plan))
+        await asyncio.sleep(0)
+        # One waiter leaving does not stop the shared run
+        first.cancel()
+        assert await second == 'solution'
+
+        third = asyncio.create_task(flights.run('key', plan))
+        await asyncio.sleep(0)
+        task = flights.flights['key'].task
+        third.cancel()
+        await asyncio.sleep(0)
+        return first, task
+
+    first, task = asyncio.run(run())
+    assert first.cancelled()
+    assert task.cancelled()
+
+def test_single_flight_retry_after_cancel():
+    flights = SingleFlight()
+    started = []
+
+    async def plan(notify):
+        started.append(True)
+        await asyncio.sleep(0.01)
+        return 'solution'
+
+    async def run():
+        first = asyncio.create_task(flights.run('key', plan))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        # Retried before the cancelled run has finished unwinding
+        return await flights.run('key', plan)
+
+    assert asyncio.run(run()) == 'solution'
+    assert started == [True, True]
+    assert not flights.flights
+
+def test_scheduler_shortest_first():
+    scheduler = JobScheduler(slots=1, max_queued=2, aging=0)
+    order = []
+    positions = {}
+
+    async def job(name):
+        order.append(name)
+        await asyncio.sleep(0.01)
+        return name
+
+    async def run():
+        running = asyncio.create_task(scheduler.run('a', 1, lambda: job('running')))
+        await asyncio.sleep(0)
+        expensive = asyncio.create_task(scheduler.run('b', 20, lambda: job('expensive'), lambda position: positions.setdefault('expensive', []).append(position)))
+        await asyncio.sleep(0)
+        cheap = asyncio.create_task(scheduler.run('c', 5, lambda: job('cheap')))
+        await asyncio.sleep(0)
+        # The queue is full, and user b already has a job
+        with pytest.raises(PlannerBusyError):
+            await scheduler.run('d', 1, lambda: job('shed'))
+        with pytest.raises(UserBusyError):
+            await scheduler.run('b', 1, lambda: job('second'))
+        return await asyncio.gather(running, expensive, cheap)
+
+    assert asyncio.run(run()) == ['running', 'expensive', 'cheap']
+    assert order == ['running', 'cheap', 'expensive']
+    # Overtaken by the cheaper job, then started
+    assert positions['expensive'] == [1, 2, 1, 0]
+    assert (scheduler.running, scheduler.queue, scheduler.user_jobs, scheduler.shed) == (0, [], {}, 1)
+
+def test_scheduler_preempts():
+    scheduler = JobScheduler(slots=1)
+
+    async def run():
+        speculative = asyncio.create_task(scheduler.run('a', 1, lambda: asyncio.sleep(10), preemptible=True))
+        await asyncio.sleep(0)
+        # Preemptible jobs never queue
+        with pytest.raises(PlannerBusyError):
+            await scheduler.run('b', 1, lambda: asyncio.sleep(0), preemptible=True)
+        # A job that has to queue takes the slot of the preemptible one
+        assert await asyncio.wait_for(scheduler.run('c', 5, lambda: asyncio.sleep(0, 'planned')), 1) == 'planned'
+        with pytest.raises(PlanPreemptedError):
+            await speculative
+
+    asyncio.run(run())
+    assert (scheduler.running, scheduler.queue, scheduler.user_jobs, scheduler.shed) == (0, [], {}, 0)
+    assert not scheduler.preemptible and not scheduler.preempted
+
+def test_scheduler_cancel_queued():
+    scheduler = JobScheduler(slots=1)
+
+    async def run():
+        running = asyncio.create_task(scheduler.run('a', 1, lambda: asyncio.sleep(0.01)))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run('b', 1, lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await running
+        return queued
+
+    assert asyncio.run(run()).cancelled()
+    assert (scheduler.running, scheduler.queue, scheduler.user_jobs) == (0, [], {})
@@ -2,6 +2,8 @@ import pytest
 import json
 import os
 from algo.mod_planner import ModPlanner
+from algo.conflict_graph import ConflictGraph
+from utils.helpers import choice_from_url
 from ortools.sat.python import cp_model
 
 def load_test_file(file_name):
@@ -30,4 +32,118 @@ def test_s1_8m_negative():
     test_mod_info = load_test_file('s1_8m_negative.json')
     planner = ModPlanner(test_modules, test_mod_info, 1, 6, test_blocked_timings, test_mod_info)
     (url, best_info, errormsg) = planner.solve()
-    assert not url
\ No newline at end of file
+    assert not url
+
+def test_s2_5m_relaxed():
+    """
+    Test sem2, 5 mods, relaxed case with a blocked timing that cannot be avoided
+    """
+    test_modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+    test_blocked_timings = {1: [], 2: [], 3: ['1200-1400'], 4: [], 5: [], 6: []}
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    test_filtered_info = load_test_file('s2_5m_positive.json')
+    test_filtered_info[0]['LEC'] = {}
+    planner = ModPlanner(test_modules, test_mod_info, 2, 24, test_blocked_timings, test_filtered_info, num_workers=2)
+    (url, best_info, errormsg) = planner.solve()
+    assert url
+    assert 'CS1101S LEC 1 overlaps with blocked timing 1200-1400 on Wednesday' in best_info
+
+def test_compact_model():
+    """
+    Lessons have fixed times, so the model should only hold one boolean per class option and one total per day
+    """
+    test_modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000', 'CS1231', 'CS2030', 'CS2040']
+    test_blocked_timings = {1: [], 2: [], 3: [], 4: [], 5: [], 6: []}
+    test_mod_info = load_test_file('s1_8m_negative.json')
+    planner = ModPlanner(test_modules, test_mod_info, 1, 6, test_blocked_timings, test_mod_info)
+    planner._reinitialize_model(hard=True)
+    variables = planner.model.Proto().variables
+    assert len(variables) == len(planner.presences) + len(planner.intervals_per_day)
+
+def test_s2_5m_positive_without_fast_path():
+    """
+    Test sem2, 5 mods, positive case solved by CP-SAT alone
+    """
+    test_modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+    test_blocked_timings = {1: [], 2: [], 3: [], 4: [], 5: [], 6: []}
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    planner = ModPlanner(test_modules, test_mod_info, 2, 24, test_blocked_timings, test_mod_info, fast_path=False)
+    (url, best_info, errormsg) = planner.solve()
+    assert url
+    assert not best_info
+
+def test_multi_option_clash():
+    """
+    Every tutorial of MOD2 clashes with the lecture of MOD1, which the single option clash check can not see
+    """
+    lesson = lambda start_time, end_time: {'day': 1, 'start_time': start_time, 'end_time': end_time}
+    test_modules = ['MOD1', 'MOD2', 'MOD3']
+    test_mod_info = [
+        {'LEC': {'1': [lesson('1000', '1200')]}},
+        {'TUT': {'1': [lesson('1000', '1100')], '2': [lesson('1100', '1200')]}},
+        {'LEC': {'1': [lesson('1400', '1600')]}},
+    ]
+    planner = ModPlanner(test_modules, test_mod_info, 1, 24, {}, test_mod_info)
+    assert planner.explain_infeasibility(soft=False) == [('module', 0), ('module', 1)]
+    (url, best_info, errormsg) = planner.solve()
+    assert not url
+    assert 'Irreconcilable clashes found between MOD1 and MOD2' in errormsg
+
+def test_explain_blocked_timing():
+    """
+    The only lecture of MOD1 falls on a blocked timing
+    """
+    lesson = lambda start_time, end_time: {'day': 1, 'start_time': start_time, 'end_time': end_time}
+    test_modules = ['MOD1', 'MOD2']
+    test_mod_info = [
+        {'LEC': {'1': [lesson('1000', '1200')]}},
+        {'TUT': {'1': [lesson('1000', '1100')], '2': [lesson('1300', '1400')]}},
+    ]
+    planner = ModPlanner(test_modules, test_mod_info, 1, 24, {1: ['0900-1100']}, test_mod_info)
+    conflicting = planner.explain_infeasibility()
+    assert conflicting == [('module', 0), ('blocked', 1, '0900-1100')]
+    assert planner.describe_condition(conflicting[1]) == 'blocked timing 0900-1100 on Monday'
+
+def test_on_solution():
+    """
+    Improving timetables are reported while the relaxed model is still being solved
+    """
+    test_modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+    test_blocked_timings = {1: [], 2: [], 3: ['1200-1400'], 4: [], 5: [], 6: []}
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    test_filtered_info = load_test_file('s2_5m_positive.json')
+    test_filtered_info[0]['LEC'] = {}
+    reported = []
+    planner = ModPlanner(test_modules, test_mod_info, 2, 24, test_blocked_timings, test_filtered_info, num_workers=2)
+    (url, best_info, errormsg) = planner.solve(on_solution=lambda url, violation_info: reported.append((url, violation_info)))
+    assert reported
+    assert all(interim_url.startswith('https://nusmods.com/timetable/sem-2/share?') for interim_url, _ in reported)
+    assert 'overlaps with blocked timing 1200-1400' in reported[-1][1]
+
+def test_hint():
+    """
+    A feasible hint is taken as the timetable, by the fast path and by CP-SAT
+    """
+    test_modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+    test_blocked_timings = {1: [], 2: [], 3: [], 4: [], 5: [], 6: []}
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    url = ModPlanner(test_modules, test_mod_info, 2, 24, test_blocked_timings, test_mod_info).solve()[0]
+    hint = choice_from_url(test_modules, url)
+    hint[(4, 'TUT')] = 'E19'
+    for fast_path in (True, False):
+        planner = ModPlanner(test_modules, test_mod_info, 2, 24, test_blocked_timings, test_mod_info, num_workers=1,
+                             fast_path=fast_path, hint=hint, conflict_graph=ConflictGraph(test_mod_info))
+        (url, best_info, errormsg) = planner.solve()
+        assert choice_from_url(test_modules, url) == hint
+
+def test_stage_timings():
+    test_modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+    test_blocked_timings = {1: [], 2: [], 3: ['1200-1400'], 4: [], 5: [], 6: []}
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    test_filtered_info = load_test_file('s2_5m_positive.json')
+    test_filtered_info[0]['LEC'] = {}
+    planner = ModPlanner(test_modules, test_mod_info, 2, 24, test_blocked_timings, test_filtered_info, num_workers=2)
+    planner.solve()
+    # The fast path already proves the hard constraints infeasible
+    assert set(planner.timings) == {'fast_path', 'explain', 'model_build', 'relaxed_solve', 'url'}
+    assert planner.model_sizes and all(variables and constraints for variables, constraints in planner.model_sizes)
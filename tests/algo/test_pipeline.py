@@ -0,0 +1,73 @@
+import pytest
+import asyncio
+from algo import db as db_module
+from algo.db import DBClient, SCHEMA_VERSION
+from algo.pipeline import PlanningInput, SpeculativePlan
+from tests.fake_mongo import FakeMongoClient
+from utils.helpers import normalize_semester_data
+
+def lesson(class_no, day, start_time, end_time):
+    return {'class_no': class_no, 'day': day, 'start_time': start_time, 'end_time': end_time}
+
+TEST_MODULES = [
+    {'mod_id': 'MA1521', 'semester_data': {'2': {
+        'LEC': {'2': [lesson('2', 1, '1000', '1200')]},
+        'TUT': {'5': [lesson('5', 2, '0900', '1000')], '6': [lesson('6', 2, '0900', '1000')], '7': [lesson('7', 3, '0900', '1000')]},
+    }}},
+]
+# Stored as ingestion does
+for module in TEST_MODULES:
+    module['schema_version'] = SCHEMA_VERSION
+    module['normalized_data'] = {semester: normalize_semester_data(data) for semester, data in module['semester_data'].items()}
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(db_module, 'MongoClient', FakeMongoClient)
+    client = DBClient()
+    client.collection.docs.extend(TEST_MODULES)
+    return client
+
+def test_single_fetch(client):
+    planning_input = PlanningInput(client, ['MA1521'], '2', [], {'Tuesday': ['0800-1000']}).load()
+    # A single batched read of the module collection
+    assert client.collection.round_trips == 1
+    assert list(planning_input.distinct[0]['TUT'].keys()) == ['5', '7']
+    assert list(planning_input.filtered[0]['TUT'].keys()) == ['7']
+    assert set(planning_input.timings) == {'fetch', 'dedup', 'filter'}
+
+def test_planner_args(client):
+    planning_input = PlanningInput(client, ['MA1521'], '2', [3], {})
+    (modules, mod_info, semester, max_hours, blocked_out_time, filtered_info) = planning_input.planner_args(4, {3: ['0000-2359']})
+    assert mod_info is planning_input.distinct
+    assert filtered_info[0]['TUT'] == {'5': [dict(lesson('5', 2, '0900', '1000'), start_min=540, end_min=600)]}
+
+def test_equivalents(client):
+    planning_input = PlanningInput(client, ['MA1521'], '2', [], {})
+    assert planning_input.equivalents == [{'LEC': {}, 'TUT': {'5': ['5', '6']}}]
+    assert planning_input.planner_kwargs() == {'equivalent_classes': planning_input.equivalents}
+
+def test_expected_cost(client):
+    planning_input = PlanningInput(client, ['MA1521'], '2', [], {})
+    # One module with a single lecture and two distinct tutorial options
+    assert planning_input.expected_cost == 2
+
+def test_speculative_plan(client):
+    async def solve(planning_input):
+        assert 'graph' in planning_input.timings
+        return ('https://nusmods.com/timetable/sem-2/share?MA1521=LEC:2,TUT:7', '', '')
+
+    async def run():
+        speculation = SpeculativePlan(client, ['MA1521'], '2', solve)
+        assert speculation.hint() is None
+        await speculation.task
+        return speculation
+
+    speculation = asyncio.run(run())
+    assert speculation.matches(['MA1521'], '2')
+    assert speculation.hint() == {(0, 'LEC'): '2', (0, 'TUT'): '7'}
+
+    # The final request only filters the prepared data again
+    planning_input = speculation.planning_input.with_constraints([], {'Tuesday': ['0800-1000']}).load()
+    assert client.collection.round_trips == 1
+    assert list(planning_input.filtered[0]['TUT'].keys()) == ['7']
+    assert planning_input.planner_kwargs()['conflict_graph'] is speculation.planning_input.conflict_graph
@@ -0,0 +1,61 @@
+import pytest
+import json
+import os
+from algo.db import DBClient
+from algo.mod_planner import ModPlanner
+from algo.session import PlanningSession
+from utils.helpers import blocked_time_merge, choice_from_url
+
+def load_test_file(file_name):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'testcases', file_name), 'r') as f:
+        return json.load(f)
+
+TEST_MODULES = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000']
+TEST_CONSTRAINTS = [
+    ([], {}, 24),
+    ([], {}, 4),
+    ([3], {}, 24),
+    ([], {'Monday': ['0800-1000']}, 24),
+    ([], {'Tuesday': ['1500-1800']}, 5),
+    ([], {'Wednesday': ['1200-1400']}, 24),
+]
+
+def filter_module_info(mod_info, blocked_days, timings):
+    # filter_module_info does not touch the database
+    return DBClient.filter_module_info(DBClient.__new__(DBClient), mod_info, blocked_days, timings)
+
+def hard_status(planner, model):
+    solver = planner._new_solver()
+    return solver.StatusName(planner._run_solver(solver, model))
+
+def test_same_as_rebuilt_model():
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    session = PlanningSession(TEST_MODULES, '2', test_mod_info)
+    for blocked_days, timings, max_hours in TEST_CONSTRAINTS:
+        filtered_info = filter_module_info(test_mod_info, blocked_days, timings)
+        planner = ModPlanner(TEST_MODULES, test_mod_info, 2, max_hours, blocked_time_merge(blocked_days, timings), filtered_info, num_workers=2)
+        planner._reinitialize_model(hard=True)
+        expected = hard_status(planner, planner.model)
+        session.constrain(blocked_days, timings, max_hours, filtered_info)
+        assert hard_status(planner, session.prepare_model({})) == expected
+
+    # Constraints seen before reuse their literals
+    n_literals = len(session.literals)
+    n_constraints = len(session.model.Proto().constraints)
+    session.constrain([3], {'Monday': ['0800-1000']}, 24, filter_module_info(test_mod_info, [3], {'Monday': ['0800-1000']}))
+    assert (len(session.literals), len(session.model.Proto().constraints)) == (n_literals, n_constraints)
+
+def test_resolve_after_edit():
+    test_mod_info = load_test_file('s2_5m_positive.json')
+    session = PlanningSession(TEST_MODULES, '2', test_mod_info)
+    hint = {}
+    for blocked_days, timings, max_hours in [([], {}, 24), ([], {'Monday': ['0800-1000']}, 24)]:
+        filtered_info = filter_module_info(test_mod_info, blocked_days, timings)
+        session.constrain(blocked_days, timings, max_hours, filtered_info)
+        planner = ModPlanner(TEST_MODULES, test_mod_info, 2, max_hours, blocked_time_merge(blocked_days, timings), filtered_info,
+                             num_workers=2, fast_path=False, hint=hint, session=session)
+        solution = planner.solve()
+        assert solution[0] and not solution[1]
+        choice = choice_from_url(TEST_MODULES, solution[0])
+        assert all(class_no in filtered_info[module_idx][class_type] for (module_idx, class_type), class_no in choice.items())
+        hint = choice
@@ -0,0 +1,64 @@
+import pytest
+from algo.snapshot import SnapshotClient, write_snapshot
+from algo.db import DBClient
+from algo.pipeline import PlanningInput
+from utils.helpers import normalize_semester_data
+
+def lesson(class_no, day, start_time, end_time):
+    return {'class_no': class_no, 'day': day, 'start_time': start_time, 'end_time': end_time}
+
+TEST_MODULES = [
+    {'mod_id': 'CS1101S', 'mod_name': 'Programming Methodology', 'semester_data': {
+        '1': {'LEC': {'1': [lesson('1', 3, '1000', '1200'), lesson('1', 5, '1000', '1200')]}},
+        '2': {'LEC': {'1': [lesson('1', 3, '1200', '1400')]}},
+    }},
+    {'mod_id': 'MA1521', 'mod_name': 'Calculus for Computing', 'semester_data': {
+        '2': {'LEC': {'2': [lesson('2', 1, '1000', '1200')]}, 'TUT': {'5': [lesson('5', 2, '0930', '1030')], '6': [lesson('6', 2, '0930', '1030')]}},
+    }},
+]
+
+@pytest.fixture
+def client(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    write_snapshot(path, TEST_MODULES, 7)
+    return SnapshotClient(path)
+
+def test_round_trip(client):
+    assert client.get_catalog_version() == 7
+    assert client.draw_module_info(['MA1521', 'CS1101S'], '2') == [TEST_MODULES[1]['semester_data']['2'], TEST_MODULES[0]['semester_data']['2']]
+    assert client.get_mod_info('CS1101S', '1') == TEST_MODULES[0]['semester_data']['1']
+
+def test_normalized(client):
+    for module in TEST_MODULES:
+        for semester, semester_data in module['semester_data'].items():
+            assert client.draw_normalized_info([module['mod_id']], semester) == [normalize_semester_data(semester_data)]
+    assert client.draw_normalized_info(['MA1521'], '1') == [None]
+
+def test_read_only(client):
+    assert not isinstance(client, DBClient)
+    assert not hasattr(client, 'refresh_module_info')
+
+def test_check_valid_mod(client):
+    assert client.check_valid_mod('CS1101S', '1')
+    assert not client.check_valid_mod('MA1521', '1')
+    assert not client.check_valid_mod('XX0000', '2')
+
+def test_planning_input(client):
+    planning_input = PlanningInput(client, ['MA1521'], '2', [], {'Tuesday': ['0800-1000']}).load()
+    assert planning_input.equivalents == [{'LEC': {}, 'TUT': {'5': ['5', '6']}}]
+    assert planning_input.filtered[0]['TUT'] == {}
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'catalog.snap'
+    path.write_bytes(b'not a snapshot' * 10)
+    with pytest.raises(ValueError):
+        SnapshotClient(str(path))
+
+def test_module_clashes(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    clashing = {'mod_id': 'CS2040S', 'semester_data': {'2': {'LEC': {'1': [lesson('1', 1, '1100', '1300')]}}}}
+    write_snapshot(path, TEST_MODULES + [clashing], 1)
+    client = SnapshotClient(path)
+    assert client.get_module_clashes('CS2040S', ['CS1101S', 'MA1521'], '2') == {
+        'MA1521': [['LEC[1] on Monday, 1100-1300', 'LEC[2] on Monday, 1000-1200']],
+    }
@@ -0,0 +1,97 @@
+import copy
+from pymongo import ReplaceOne, UpdateOne, DeleteOne, DeleteMany
+from types import SimpleNamespace
+
+def _get_path(doc, path):
+    for key in path.split('.'):
+        if not isinstance(doc, dict) or key not in doc:
+            return None, False
+        doc = doc[key]
+    return doc, True
+
+def _matches(doc, query):
+    for path, condition in query.items():
+        value, exists = _get_path(doc, path)
+        if isinstance(condition, dict) and any(key.startswith('$') for key in condition):
+            if '$exists' in condition and exists != condition['$exists']:
+                return False
+            if '$in' in condition and (not exists or value not in condition['$in']):
+                return False
+            if '$nin' in condition and exists and value in condition['$nin']:
+                return False
+        elif not exists or value != condition:
+            return False
+    return True
+
+class FakeCollection:
+    """In-process stand-in for the few pymongo collection methods used by DBClient, counting every round trip."""
+
+    def __init__(self):
+        self.docs = []
+        self.round_trips = 0
+
+    def find_one(self, query, projection=None):
+        self.round_trips += 1
+        for doc in self.docs:
+            if _matches(doc, query):
+                return copy.deepcopy(doc)
+        return None
+
+    def find(self, query=None, projection=None):
+        self.round_trips += 1
+        return [copy.deepcopy(doc) for doc in self.docs if _matches(doc, query or {})]
+
+    def insert_many(self, docs):
+        self.round_trips += 1
+        self.docs.extend(copy.deepcopy(docs))
+        return SimpleNamespace(inserted_ids=list(range(len(docs))))
+
+    def delete_many(self, query):
+        self.round_trips += 1
+        kept = [doc for doc in self.docs if not _matches(doc, query)]
+        deleted_count = len(self.docs) - len(kept)
+        self.docs = kept
+        return SimpleNamespace(deleted_count=deleted_count)
+
+    def _update(self, query, update, upsert):
+        for doc in self.docs:
+            if _matches(doc, query):
+                break
+        else:
+            if not upsert:
+                return None
+            doc = dict(query)
+            self.docs.append(doc)
+        for key, value in update.get('$inc', {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key, value in update.get('$set', {}).items():
+            doc[key] = copy.deepcopy(value)
+        return doc
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.round_trips += 1
+        doc = self._update(query, update, upsert)
+        return copy.deepcopy(doc)
+
+    def bulk_write(self, requests, ordered=True):
+        self.round_trips += 1
+        for request in requests:
+            if isinstance(request, ReplaceOne):
+                for idx, doc in enumerate(self.docs):
+                    if _matches(doc, request._filter):
+                        self.docs[idx] = copy.deepcopy(request._doc)
+                        break
+                else:
+                    if request._upsert:
+                        self.docs.append(copy.deepcopy(request._doc))
+            elif isinstance(request, UpdateOne):
+                self._update(request._filter, request._doc, request._upsert)
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                matching = [doc for doc in self.docs if _matches(doc, request._filter)]
+                for doc in matching[:1] if isinstance(request, DeleteOne) else matching:
+                    self.docs.remove(doc)
+        return SimpleNamespace(acknowledged=True)
+
+class FakeMongoClient:
+    def __init__(self, *args, **kwargs):
+        self.nusmods = SimpleNamespace(module_info=FakeCollection(), catalog_meta=FakeCollection(), module_clashes=FakeCollection())
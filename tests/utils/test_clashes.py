@@ -0,0 +1,50 @@
+import random
+import pytest
+from utils.clashes import overlapping_pairs, module_clashes
+from utils.helpers import check_overlaps
+from utils.schedule import ScheduleData
+
+def lesson(day, start_time, end_time):
+    return {'day': day, 'start_time': start_time, 'end_time': end_time}
+
+@pytest.mark.parametrize('batch_pairs', [1, 7, 1 << 22])
+def test_overlapping_pairs_match_brute_force(batch_pairs):
+    rng = random.Random(batch_pairs)
+    day = [rng.randint(1, 3) for _ in range(300)]
+    start = [rng.randrange(480, 1200, 30) for _ in range(300)]
+    end = [lesson_start + rng.choice([0, 30, 60, 120]) for lesson_start in start]
+    expected = {(i, j) for i in range(300) for j in range(i + 1, 300)
+                if day[i] == day[j] and start[i] < end[j] and start[j] < end[i] and start[i] < end[i] and start[j] < end[j]}
+    found = set()
+    for rows1, rows2 in overlapping_pairs(day, start, end, batch_pairs):
+        for row1, row2 in zip(rows1.tolist(), rows2.tolist()):
+            pair = (min(row1, row2), max(row1, row2))
+            assert pair not in found
+            found.add(pair)
+    assert found == expected
+
+def test_overlapping_pairs_skip_empty_lessons():
+    # The empty lesson at 0900 lies strictly inside the first one, the last two do overlap
+    pairs = [(rows1.tolist(), rows2.tolist()) for rows1, rows2 in overlapping_pairs([1, 1, 2, 2], [480, 540, 600, 630], [600, 540, 660, 690])]
+    assert sum(len(rows1) for rows1, _ in pairs) == 1
+    assert sorted(pairs[0][0] + pairs[0][1]) == [2, 3]
+
+def test_module_clashes():
+    schedule = ScheduleData.from_mod_info([
+        {'LEC': {'1': [lesson(1, '1000', '1200')]}, 'TUT': {'01': [lesson(1, '1100', '1200')], '02': [lesson(2, '1000', '1100')]}},
+        {'LEC': {'1': [lesson(1, '1100', '1300')]}},
+        {'LEC': {'1': [lesson(1, '1200', '1400')]}},
+    ])
+    clashes = module_clashes(schedule)
+    assert list(clashes) == [(0, 1), (1, 2)]
+    assert [(clash.class_type1, clash.class_no1) for clash in clashes[(0, 1)]] == [('LEC', '1'), ('TUT', '01')]
+    assert clashes[(1, 2)][0].as_overlap() == {'module1': 'LEC[1] on Monday, 1100-1300', 'module2': 'LEC[1] on Monday, 1200-1400'}
+    assert [clash.class_type1 for clash in module_clashes(schedule, single_only=True)[(0, 1)]] == ['LEC']
+
+def test_check_overlaps_order():
+    module1 = {'LEC': {'1': [lesson(2, '1000', '1200'), lesson(1, '1000', '1200')]}}
+    module2 = {'TUT': {'1': [lesson(1, '1100', '1200')], '2': [lesson(2, '0900', '1100')]}}
+    assert check_overlaps(module1, module2) == [
+        {'module1': 'LEC[1] on Tuesday, 1000-1200', 'module2': 'TUT[2] on Tuesday, 0900-1100'},
+        {'module1': 'LEC[1] on Monday, 1000-1200', 'module2': 'TUT[1] on Monday, 1100-1200'},
+    ]
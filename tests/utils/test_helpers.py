@@ -30,4 +30,37 @@ def test_format_time():
     assert format_time(time_int) == '0800'
 
     time_int = 0
-    assert format_time(time_int) == '0000'
\ No newline at end of file
+    assert format_time(time_int) == '0000'
+
+def test_lesson_bitmask():
+    monday = lesson_bitmask(1, parse_time('0800'), parse_time('1000'))
+    assert bin(monday).count('1') == 120 // SLOT_MINUTES
+    assert not monday & lesson_bitmask(1, parse_time('1000'), parse_time('1100'))
+    assert monday & lesson_bitmask(1, parse_time('0955'), parse_time('1100'))
+    assert not monday & lesson_bitmask(2, parse_time('0800'), parse_time('1000'))
+
+def test_class_signature():
+    class1 = [{'day': 2, 'start_time': '1000', 'end_time': '1100'}, {'day': 1, 'start_time': '0900', 'end_time': '1000'}]
+    class2 = [{'day': 1, 'start_time': '0900', 'end_time': '1000'}, {'day': 2, 'start_time': '1000', 'end_time': '1100'}]
+    assert class_signature(class1) == class_signature(class2)
+    assert class_signature(class1) != class_signature(class2[:1])
+
+def test_normalize_semester_data():
+    semester_data = {'TUT': {
+        '1': [{'class_no': '1', 'day': 2, 'start_time': '0900', 'end_time': '1000'}],
+        '2': [{'class_no': '2', 'day': 2, 'start_time': '0900', 'end_time': '1000'}],
+        '3': [{'class_no': '3', 'day': 3, 'start_time': '1030', 'end_time': '1130'}],
+    }}
+    normalized = normalize_semester_data(semester_data)
+    assert list(normalized['classes']['TUT']) == ['1', '3']
+    assert lesson_minutes(normalized['classes']['TUT']['3'][0]) == (630, 690)
+    assert normalized['equivalents']['TUT'] == {'1': ['1', '2']}
+    assert normalized['option_counts'] == {'TUT': 2}
+    assert set(normalized) == {'classes', 'equivalents', 'option_counts'}
+
+def test_choice_from_url():
+    url = "https://nusmods.com/timetable/sem-2/share?CS1101S=TUT:01,REC:02,LEC:1&MA1521=TUT:5,LEC:2"
+    choice = choice_from_url(['CS1101S', 'MA1521'], url)
+    assert choice == {(0, 'TUT'): '01', (0, 'REC'): '02', (0, 'LEC'): '1', (1, 'TUT'): '5', (1, 'LEC'): '2'}
+    url_info = [[f"{class_type}:{class_no}," for (module_idx, class_type), class_no in choice.items() if module_idx == i] for i in range(2)]
+    assert url_generator(['CS1101S', 'MA1521'], url_info, '2') == url
@@ -0,0 +1,50 @@
+import json
+import logging
+import urllib.request
+import urllib.error
+import pytest
+from utils.metrics import Registry, start_metrics_server
+from utils.logs import JsonFormatter, KeyValueFormatter
+
+def test_render():
+    registry = Registry()
+    stages = registry.histogram('stage_seconds', 'Stage latency.', buckets=(0.1, 1.0))
+    stages.observe(0.05, stage='fetch')
+    stages.observe(0.5, stage='fetch')
+    stages.observe(5.0, stage='fetch')
+    registry.counter('requests_total', 'Requests.').inc(source='cache')
+    registry.callback('queue_depth', 'Queued jobs.', lambda: 3)
+
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="fetch",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="fetch",le="1.0"} 2' in text
+    assert 'stage_seconds_bucket{stage="fetch",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{stage="fetch"} 3' in text
+    assert 'stage_seconds_sum{stage="fetch"} 5.55' in text
+    assert 'requests_total{source="cache"} 1' in text
+    assert 'queue_depth 3' in text
+    # Declaring a metric again returns the existing one
+    assert registry.histogram('stage_seconds', 'Stage latency.') is stages
+
+def test_endpoint():
+    registry = Registry()
+    registry.counter('requests_total', 'Requests.').inc()
+    server = start_metrics_server(0, registry=registry)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        with urllib.request.urlopen(f'{url}/metrics') as resp:
+            assert resp.headers['Content-Type'].startswith('text/plain')
+            assert 'requests_total 1' in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'{url}/other')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_structured_logs():
+    record = logging.LogRecord('algo.mod_planner', logging.INFO, __file__, 1, 'Solver statistics', (), None)
+    record.conflicts = 3
+    entry = json.loads(JsonFormatter().format(record))
+    assert (entry['logger'], entry['message'], entry['conflicts']) == ('algo.mod_planner', 'Solver statistics', 3)
+    assert KeyValueFormatter('%(message)s').format(record) == 'Solver statistics conflicts=3'
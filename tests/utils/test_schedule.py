@@ -0,0 +1,58 @@
+import json
+import os
+import random
+import pytest
+from algo.db import DBClient
+from algo.mod_planner import ModPlanner
+from utils.helpers import check_overlaps, single_timeslot_filter, check_block_timings, format_time
+from utils.schedule import ScheduleData, BlockedTimes
+
+def load_test_file(file_name):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'testcases', file_name), 'r') as f:
+        return json.load(f)
+
+@pytest.fixture
+def mod_info():
+    return load_test_file('s1_8m_negative.json')
+
+def test_round_trip(mod_info):
+    schedule = ScheduleData.from_mod_info(mod_info)
+    assert schedule.to_mod_info() == mod_info
+    assert len(schedule) == sum(len(class_list) for module in mod_info for lessons in module.values() for class_list in lessons.values())
+    assert schedule.lesson(0) is next(iter(next(iter(mod_info[0].values())).values()))[0]
+
+def test_filters_match_dicts(mod_info):
+    schedule = ScheduleData.from_mod_info(mod_info)
+    assert single_timeslot_filter(schedule).to_mod_info() == single_timeslot_filter(mod_info)
+
+    client = DBClient.__new__(DBClient)
+    blocked_timings = {1: ['0800-1000'], 3: ['1200-1400', '1600-1800']}
+    assert client.module_days_filtered(schedule, [5], blocked_timings).to_mod_info() == client.module_days_filtered(mod_info, [5], blocked_timings)
+
+def test_check_overlaps_matches_dicts(mod_info):
+    schedule = ScheduleData.from_mod_info(mod_info)
+    for i in range(len(mod_info)):
+        for j in range(i + 1, len(mod_info)):
+            assert check_overlaps(schedule.module(i), schedule.module(j)) == check_overlaps(mod_info[i], mod_info[j])
+
+def test_planner_accepts_schedule(mod_info):
+    modules = ['CS1101S', 'MA1521', 'MA1522', 'IS1108', 'GEA1000', 'CS1231', 'CS2030', 'CS2040']
+    schedule = ScheduleData.from_mod_info(mod_info)
+    planner = ModPlanner(modules, schedule, 1, 24, {}, schedule)
+    assert planner.solve() == ModPlanner(modules, mod_info, 1, 24, {}, mod_info).solve()
+
+def test_blocked_times_match_check_block_timings():
+    rng = random.Random(0)
+    times = [format_time(minutes) for minutes in range(0, 24 * 60, 30)] + ['2359']
+    for _ in range(200):
+        blocked_timings = {day: [f'{rng.choice(times)}-{rng.choice(times)}' for _ in range(rng.randint(0, 3))] for day in range(1, 7)}
+        lessons = [{'day': rng.randint(1, 6), 'start_time': rng.choice(times), 'end_time': rng.choice(times)} for _ in range(50)]
+        blocked_times = BlockedTimes([], blocked_timings)
+        schedule = ScheduleData.from_mod_info([{'LEC': {str(idx): [lesson] for idx, lesson in enumerate(lessons)}}])
+        expected = [check_block_timings(lesson, blocked_timings) for lesson in lessons]
+        assert blocked_times.lessons_blocked(schedule.day, schedule.start, schedule.end).tolist() == expected
+
+def test_blocked_days():
+    schedule = ScheduleData.from_mod_info([{'LEC': {'1': [{'day': 2, 'start_time': '1000', 'end_time': '1200'}]}}])
+    assert BlockedTimes([2], {}).lessons_blocked(schedule.day, schedule.start, schedule.end).tolist() == [True]
+    assert BlockedTimes([3], {}).lessons_blocked(schedule.day, schedule.start, schedule.end).tolist() == [False]
@@ -0,0 +1,94 @@
+import numpy as np
+from collections import defaultdict, namedtuple
+from utils.helpers import int_to_days, format_time
+from utils.schedule import ScheduleData
+
+# Sort key stride per day, larger than any minute of a day
+DAY_STRIDE = 4096
+# Candidate lesson pairs generated at once, which bounds memory on whole-catalog schedules
+SWEEP_BATCH_PAIRS = 1 << 22
+
+def overlapping_pairs(day, start, end, batch_pairs: int = SWEEP_BATCH_PAIRS):
+    """
+    Yields (rows1, rows2) arrays of the lesson rows that share time, every overlapping pair exactly once.
+
+    The lessons are sorted by (day, start) once. A lesson can then only overlap the lessons that follow it in that
+    order and start before it ends on the same day, which is a contiguous run found with a binary search. The runs are
+    expanded in batches of about batch_pairs pairs. Lessons without duration never overlap anything.
+    """
+    day = np.asarray(day, dtype=np.int64)
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    # Dropped up front, as one that starts strictly inside another lesson would still pass the overlap test below
+    timed = np.flatnonzero(start < end)
+    day, start, end = day[timed], start[timed], end[timed]
+    n_lessons = len(day)
+    if n_lessons == 0:
+        return
+
+    order = np.lexsort((start, day))
+    sorted_start, sorted_end = start[order], end[order]
+    # Rows of the sorted lessons in the arrays passed in
+    rows = timed[order]
+    keys = day[order] * DAY_STRIDE + sorted_start
+    stops = np.searchsorted(keys, day[order] * DAY_STRIDE + sorted_end, side='left')
+    counts = np.maximum(stops - np.arange(n_lessons) - 1, 0)
+    total = np.cumsum(counts)
+
+    first = 0
+    while first < n_lessons:
+        done = total[first - 1] if first else 0
+        last = max(first + 1, int(np.searchsorted(total, done + batch_pairs, side='right')))
+        run_counts = counts[first:last]
+        rows1 = np.repeat(np.arange(first, last), run_counts)
+        # Position within each run, so that the pairs of lesson i are i + 1, i + 2, ...
+        run_starts = np.repeat(np.cumsum(run_counts) - run_counts, run_counts)
+        rows2 = rows1 + 1 + np.arange(len(rows1)) - run_starts
+        overlapping = (sorted_start[rows1] < sorted_end[rows2]) & (sorted_start[rows2] < sorted_end[rows1])
+        yield rows[rows1[overlapping]], rows[rows2[overlapping]]
+        first = last
+
+class Clash(namedtuple('Clash', ['module_idx1', 'class_type1', 'class_no1', 'module_idx2', 'class_type2', 'class_no2',
+                                 'day', 'start1', 'end1', 'start2', 'end2', 'row1', 'row2'])):
+    """Two overlapping lessons of different modules, with module_idx1 < module_idx2 and times in minutes."""
+    __slots__ = ()
+
+    def as_overlap(self) -> dict:
+        """The clash in the format of helpers.check_overlaps."""
+        day = int_to_days(self.day)
+        return {
+            'module1': f"{self.class_type1}[{self.class_no1}] on {day}, {format_time(self.start1)}-{format_time(self.end1)}",
+            'module2': f"{self.class_type2}[{self.class_no2}] on {day}, {format_time(self.start2)}-{format_time(self.end2)}",
+        }
+
+def module_clashes(schedule: ScheduleData, single_only: bool = False) -> dict:
+    """
+    Clashes between lessons of different modules, as lists of Clash keyed on (module_idx1, module_idx2) with
+    module_idx1 < module_idx2. Within a pair, clashes are ordered by the lessons of the first and then the second module.
+
+    single_only: only consider lesson types with a single class option, whose clashes can never be avoided
+    """
+    rows = np.arange(len(schedule))
+    if single_only:
+        rows = rows[schedule.option_counts[schedule.type_idx] == 1]
+
+    clashes = defaultdict(list)
+    for rows1, rows2 in overlapping_pairs(schedule.day[rows], schedule.start[rows], schedule.end[rows]):
+        rows1, rows2 = rows[rows1], rows[rows2]
+        between_modules = schedule.module_idx[rows1] != schedule.module_idx[rows2]
+        rows1, rows2 = rows1[between_modules], rows2[between_modules]
+        swap = schedule.module_idx[rows1] > schedule.module_idx[rows2]
+        rows1, rows2 = np.where(swap, rows2, rows1), np.where(swap, rows1, rows2)
+        for row1, row2 in zip(rows1.tolist(), rows2.tolist()):
+            class_idx1, class_idx2 = schedule.class_idx[row1], schedule.class_idx[row2]
+            clash = Clash(
+                int(schedule.module_idx[row1]), schedule.type_names[schedule.class_type[class_idx1]], schedule.class_nos[class_idx1],
+                int(schedule.module_idx[row2]), schedule.type_names[schedule.class_type[class_idx2]], schedule.class_nos[class_idx2],
+                int(schedule.day[row1]), int(schedule.start[row1]), int(schedule.end[row1]),
+                int(schedule.start[row2]), int(schedule.end[row2]), row1, row2,
+            )
+            clashes[(clash.module_idx1, clash.module_idx2)].append(clash)
+
+    for pair_clashes in clashes.values():
+        pair_clashes.sort(key=lambda clash: (clash.row1, clash.row2))
+    return dict(sorted(clashes.items()))
@@ -114,12 +114,11 @@ def check_block_timings(lesson_info: dict, blocked_slots: dict) -> bool:
     if day not in blocked_slots:
         return False
     timings_list = blocked_slots[day]
-    lesson_start = int(lesson_info['start_time'])
-    lesson_end = int(lesson_info['end_time'])
+    lesson_start, lesson_end = lesson_minutes(lesson_info)
     for timing in timings_list:
         time = timing.split('-')
-        start_block = int(time[0])
-        end_block = int(time[1])
+        start_block = parse_time(time[0])
+        end_block = parse_time(time[1])
         #lesson starts in block
         if lesson_start < end_block and lesson_start >= start_block:
             return True
@@ -143,6 +142,60 @@ def format_time(minutes):
     minutes = minutes % 60
     return f'{hours:02d}{minutes:02d}'
 
+def lesson_minutes(lesson_info: dict) -> tuple:
+    """(start, end) of a lesson in minutes since midnight, using the values stored at ingestion when present."""
+    if 'start_min' in lesson_info:
+        return lesson_info['start_min'], lesson_info['end_min']
+    return parse_time(lesson_info['start_time']), parse_time(lesson_info['end_time'])
+
+def class_signature(class_list: list) -> tuple:
+    """Canonical (day, start_time, end_time) tuple of a class, equal for classes whose lessons are at the same times."""
+    return tuple(sorted((lesson['day'], lesson['start_time'], lesson['end_time']) for lesson in class_list))
+
+# Lessons are placed on a week grid of 5-minute slots, one bit per slot
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+def lesson_bitmask(day: int, start: int, end: int) -> int:
+    """Week bitmask of the slots a lesson occupies, with start and end in minutes since midnight."""
+    first = (day - 1) * SLOTS_PER_DAY + start // SLOT_MINUTES
+    last = (day - 1) * SLOTS_PER_DAY + -(-end // SLOT_MINUTES)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+def normalize_semester_data(semester_data: dict) -> dict:
+    """
+    Planner-ready form of a module's semester data, stored next to the raw data at ingestion.
+
+    classes only keeps the first class of every group with identical lesson times, and its lessons carry their times
+    in minutes as start_min and end_min. equivalents lists the groups with more than one class.
+    """
+    normalized = {'classes': {}, 'equivalents': {}, 'option_counts': {}}
+    for class_type, class_groups in semester_data.items():
+        classes = {}
+        kept_class_nos = {}
+        groups = {}
+        for class_no, class_list in class_groups.items():
+            signature = class_signature(class_list)
+            kept_class_no = kept_class_nos.get(signature)
+            if kept_class_no is not None:
+                groups[kept_class_no].append(class_no)
+                continue
+
+            kept_class_nos[signature] = class_no
+            groups[class_no] = [class_no]
+            lessons = []
+            for lesson_info in class_list:
+                start, end = lesson_minutes(lesson_info)
+                lessons.append({**lesson_info, 'start_min': start, 'end_min': end})
+            classes[class_no] = lessons
+
+        normalized['classes'][class_type] = classes
+        normalized['equivalents'][class_type] = {class_no: group for class_no, group in groups.items() if len(group) > 1}
+        normalized['option_counts'][class_type] = len(classes)
+    return normalized
+
 def url_generator(modules: list, class_info: list, semester: str) -> str:
     mod_info = ""
     for i, module in enumerate(modules):
@@ -152,7 +205,25 @@ def url_generator(modules: list, class_info: list, semester: str) -> str:
         mod_info = mod_info[:-1] + '&'
     return f"https://nusmods.com/timetable/sem-{semester}/share?{mod_info[:-1]}"
 
+def choice_from_url(modules: list, url: str) -> dict:
+    """Inverse of url_generator, maps (module_idx, class_type) to the class_no chosen in url."""
+    module_idx = {module: idx for idx, module in enumerate(modules)}
+    choice = {}
+    for module_info in url.split('?', 1)[-1].split('&'):
+        module, _, classes = module_info.partition('=')
+        if module not in module_idx or not classes:
+            continue
+        for selected in classes.split(','):
+            class_type, _, class_no = selected.partition(':')
+            choice[(module_idx[module], class_type)] = class_no
+    return choice
+
 def single_timeslot_filter(distinct_mod_info: list) -> list:
+    # utils.schedule imports this module, so it is imported on use
+    from utils.schedule import ScheduleData
+    if isinstance(distinct_mod_info, ScheduleData):
+        return distinct_mod_info.select(keep_types=distinct_mod_info.option_counts == 1)
+
     filtered_info = []
     for module in distinct_mod_info:
         filtered_module = {}
@@ -163,23 +234,9 @@ def single_timeslot_filter(distinct_mod_info: list) -> list:
     return filtered_info
 
 def check_overlaps(module1_info, module2_info):
-    overlaps = []
-    for class_type1, lessons1 in module1_info.items():
-        for times1 in lessons1.values():
-            for class1 in times1:
-                day1 = class1['day']
-                start1 = parse_time(class1['start_time'])
-                end1 = parse_time(class1['end_time'])
-                for class_type2, lessons2 in module2_info.items():
-                    for times2 in lessons2.values():
-                        for class2 in times2:
-                            day2 = class2['day']
-                            start2 = parse_time(class2['start_time'])
-                            end2 = parse_time(class2['end_time'])
-                            # Check for any overlap
-                            if day1 == day2 and start1 < end2 and start2 < end1:
-                                overlaps.append({
-                                    'module1': f"{class_type1}[{class1['class_no']}] on {int_to_days(day1)}, {class1['start_time']}-{class1['end_time']}",
-                                    'module2': f"{class_type2}[{class2['class_no']}] on {int_to_days(day2)}, {class2['start_time']}-{class2['end_time']}"
-                                })
-    return overlaps
+    """Overlapping lessons of two modules, each given as {class_type: {class_no: [lesson]}} or a single-module ScheduleData."""
+    # utils.schedule and utils.clashes import this module, so they are imported on use
+    from utils.schedule import ScheduleData
+    from utils.clashes import module_clashes
+    mod_info = [info.to_mod_info()[0] if isinstance(info, ScheduleData) else info for info in (module1_info, module2_info)]
+    return [clash.as_overlap() for clash in module_clashes(ScheduleData.from_mod_info(mod_info)).get((0, 1), [])]
@@ -4,4 +4,23 @@ load_dotenv()
 MONGO_CONN_STRING = os.getenv('MONGO_CONN_STRING')
 # MONGO_CONN_STRING = os.environ['MONGO_CONN_STRING']
 BOT_API_KEY = os.getenv('BOT_API_KEY')
-# BOT_API_KEY = os.environ['BOT_API_KEY']
\ No newline at end of file
+# BOT_API_KEY = os.environ['BOT_API_KEY']
+PLAN_CACHE_DIR = os.getenv('PLAN_CACHE_DIR')
+# Catalog snapshot written by scripts/snapshot.py, the bot reads it instead of Mongo when set
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH')
+SOLVER_PROCESSES = int(os.getenv('SOLVER_PROCESSES', '2'))
+MAX_PENDING_JOBS = int(os.getenv('MAX_PENDING_JOBS', '16'))
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', '32'))
+MAX_USER_JOBS = int(os.getenv('MAX_USER_JOBS', '1'))
+JOB_DEADLINE = float(os.getenv('JOB_DEADLINE', '600'))
+# Users whose CP-SAT planning model every solver process keeps for re-planning, and the seconds an unused one is kept.
+# The bot keeps as many previous timetables as hints
+MAX_PLANNING_SESSIONS = int(os.getenv('MAX_PLANNING_SESSIONS', '64'))
+PLANNING_SESSION_TTL = float(os.getenv('PLANNING_SESSION_TTL', '3600'))
+# Port of the local Prometheus metrics endpoint, which is off when unset
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# text or json
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Level of the planner's solve details, WARNING switches them off
+PLANNER_LOG_LEVEL = os.getenv('PLANNER_LOG_LEVEL', 'INFO')
@@ -0,0 +1,50 @@
+import json
+import logging
+
+# Attributes every LogRecord has, anything else on a record was passed through extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """Fields passed to a log call through extra."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+class KeyValueFormatter(logging.Formatter):
+    """The usual text format, followed by the extra fields as key=value pairs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            text += ' ' + ' '.join(f'{key}={value!r}' for key, value in fields.items())
+        return text
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the extra fields as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(level: str = 'INFO', log_format: str = 'text', planner_level: str = None) -> None:
+    """
+    Sets up the root logger for the bot.
+
+    log_format: 'text' or 'json'
+    planner_level: level of the planner's own logs, e.g. WARNING to switch its solve details off in production
+    """
+    handler = logging.StreamHandler()
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+    if planner_level:
+        logging.getLogger('algo.mod_planner').setLevel(planner_level)
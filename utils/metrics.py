@@ -0,0 +1,184 @@
+import math
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from a cached lookup up to a solve that runs into its deadline
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+SIZE_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels_text(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock):
+        self.name = name
+        self.help_text = help_text
+        self._lock = lock
+        self._values = {}
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def samples(self) -> list:
+        """(name, labels, value) of every series."""
+        return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            samples = self.samples()
+        lines += [f'{name}{_labels_text(labels)} {_number(value)}' for name, labels, value in samples]
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+class CallbackMetric(_Metric):
+    """Counter or gauge whose value is read from func() whenever the metrics are rendered."""
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock, type_name: str, func):
+        super().__init__(name, help_text, lock)
+        self.type_name = type_name
+        self.func = func
+
+    def samples(self) -> list:
+        return [(self.name, (), self.func())]
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, lock)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the seconds spent in the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def samples(self) -> list:
+        samples = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key + (('le', _number(bound)),), cumulative))
+            samples.append((f'{self.name}_count', key, cumulative))
+            samples.append((f'{self.name}_sum', key, total))
+        return samples
+
+class Registry:
+    """Metrics of one process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        # Registering a name again returns the existing metric, so that modules can declare what they use
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text, self._lock))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text, self._lock))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, self._lock, buckets))
+
+    def callback(self, name: str, help_text: str, func, type_name: str = 'gauge') -> CallbackMetric:
+        """Metric read from func() on every scrape, replacing an earlier callback of the same name."""
+        metric = self.metrics[name] = CallbackMetric(name, help_text, self._lock, type_name, func)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in list(self.metrics.values())) + '\n'
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram('planbetterlah_stage_seconds', 'Seconds spent in each stage of planning a timetable.')
+MODEL_VARIABLES = REGISTRY.histogram('planbetterlah_model_variables', 'Variables of the CP-SAT models that were solved.', SIZE_BUCKETS)
+MODEL_CONSTRAINTS = REGISTRY.histogram('planbetterlah_model_constraints', 'Constraints of the CP-SAT models that were solved.', SIZE_BUCKETS)
+
+def observe_stages(timings: dict) -> None:
+    """Records {stage: seconds} in the stage latency histogram."""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+def observe_model_sizes(model_sizes: list) -> None:
+    """Records the (variables, constraints) of solved models."""
+    for variables, constraints in model_sizes:
+        MODEL_VARIABLES.observe(variables)
+        MODEL_CONSTRAINTS.observe(constraints)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int, host: str = '127.0.0.1', registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serves registry on http://host:port/metrics from a daemon thread. Port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,172 @@
+import numpy as np
+from utils.helpers import lesson_minutes, parse_time
+
+MINUTES_PER_DAY = 24 * 60
+
+class ScheduleData:
+    """
+    Lessons of a list of modules as flat NumPy arrays, one row per lesson.
+
+    Every lesson row has its module_idx, type_idx, class_idx, day, start and end, with times in minutes since
+    midnight. Lesson types are numbered module by module, classes type by type and lesson rows class by class, so the
+    offset tables give the contiguous range of each: the types of module m are module_offsets[m]:module_offsets[m + 1],
+    the classes of type t are type_offsets[t]:type_offsets[t + 1] and the lessons of class c are
+    class_offsets[c]:class_offsets[c + 1]. The original lesson dicts are kept in class_lists for display.
+    """
+
+    def __init__(self, n_modules: int, type_module, type_names: list, class_type, class_nos: list, class_lists: list,
+                 class_idx, day, start, end):
+        self.n_modules = n_modules
+        self.type_module = np.asarray(type_module, dtype=np.int32)
+        self.type_names = type_names
+        self.class_type = np.asarray(class_type, dtype=np.int32)
+        self.class_nos = class_nos
+        self.class_lists = class_lists
+        self.class_idx = np.asarray(class_idx, dtype=np.int32)
+        self.day = np.asarray(day, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int32)
+        self.end = np.asarray(end, dtype=np.int32)
+
+        self.type_idx = self.class_type[self.class_idx]
+        self.class_module = self.type_module[self.class_type]
+        self.module_idx = self.class_module[self.class_idx]
+        self.module_offsets = self._offsets(self.type_module, n_modules)
+        self.type_offsets = self._offsets(self.class_type, len(type_names))
+        self.class_offsets = self._offsets(self.class_idx, len(class_nos))
+
+    @staticmethod
+    def _offsets(owner, n_owners: int):
+        return np.concatenate(([0], np.cumsum(np.bincount(owner, minlength=n_owners)))).astype(np.int32)
+
+    @classmethod
+    def from_mod_info(cls, mod_info: list) -> 'ScheduleData':
+        """Converts the [{class_type: {class_no: [lesson]}}] shape drawn from the database."""
+        type_module, type_names = [], []
+        class_type, class_nos, class_lists = [], [], []
+        class_idx, day, start, end = [], [], [], []
+        for module_idx, module in enumerate(mod_info):
+            for type_name, lessons in module.items():
+                type_module.append(module_idx)
+                type_names.append(type_name)
+                for class_no, class_list in lessons.items():
+                    class_type.append(len(type_names) - 1)
+                    class_nos.append(class_no)
+                    class_lists.append(class_list)
+                    for lesson in class_list:
+                        lesson_start, lesson_end = lesson_minutes(lesson)
+                        class_idx.append(len(class_nos) - 1)
+                        day.append(lesson['day'])
+                        start.append(lesson_start)
+                        end.append(lesson_end)
+        return cls(len(mod_info), type_module, type_names, class_type, class_nos, class_lists, class_idx, day, start, end)
+
+    @classmethod
+    def coerce(cls, mod_info) -> 'ScheduleData':
+        """mod_info itself if it already is a ScheduleData, else its conversion."""
+        if isinstance(mod_info, cls):
+            return mod_info
+        return cls.from_mod_info(mod_info)
+
+    def to_mod_info(self) -> list:
+        """Converts back to the [{class_type: {class_no: [lesson]}}] shape, sharing the original lesson lists."""
+        mod_info = []
+        for module_idx in range(self.n_modules):
+            module = {}
+            for type_idx in range(self.module_offsets[module_idx], self.module_offsets[module_idx + 1]):
+                class_range = range(self.type_offsets[type_idx], self.type_offsets[type_idx + 1])
+                module[self.type_names[type_idx]] = {self.class_nos[class_idx]: self.class_lists[class_idx] for class_idx in class_range}
+            mod_info.append(module)
+        return mod_info
+
+    def __len__(self) -> int:
+        return len(self.class_idx)
+
+    @property
+    def option_counts(self):
+        """Number of classes of every lesson type."""
+        return np.diff(self.type_offsets)
+
+    def lesson(self, row: int) -> dict:
+        """Original lesson dict of a lesson row."""
+        class_idx = self.class_idx[row]
+        return self.class_lists[class_idx][row - self.class_offsets[class_idx]]
+
+    def select(self, keep_classes=None, keep_types=None) -> 'ScheduleData':
+        """
+        Schedule with only the classes and lesson types whose entries in the boolean arrays keep_classes and keep_types
+        are set. A lesson type that loses all of its classes is kept without options, as in module_days_filtered.
+        """
+        if keep_types is None:
+            keep_types = np.ones(len(self.type_names), dtype=bool)
+        if keep_classes is None:
+            keep_classes = np.ones(len(self.class_nos), dtype=bool)
+        keep_classes = keep_classes & keep_types[self.class_type]
+        keep_lessons = keep_classes[self.class_idx]
+
+        type_ids = np.flatnonzero(keep_types)
+        class_ids = np.flatnonzero(keep_classes)
+        # Old index -> new index of the kept types and classes
+        type_map = np.cumsum(keep_types) - 1
+        class_map = np.cumsum(keep_classes) - 1
+        return ScheduleData(
+            self.n_modules,
+            self.type_module[type_ids],
+            [self.type_names[type_idx] for type_idx in type_ids],
+            type_map[self.class_type[class_ids]],
+            [self.class_nos[class_idx] for class_idx in class_ids],
+            [self.class_lists[class_idx] for class_idx in class_ids],
+            class_map[self.class_idx[keep_lessons]],
+            self.day[keep_lessons],
+            self.start[keep_lessons],
+            self.end[keep_lessons],
+        )
+
+    def module(self, module_idx: int) -> 'ScheduleData':
+        """Schedule of a single module."""
+        sub_schedule = self.select(keep_types=self.type_module == module_idx)
+        return ScheduleData(1, np.zeros_like(sub_schedule.type_module), sub_schedule.type_names, sub_schedule.class_type,
+                            sub_schedule.class_nos, sub_schedule.class_lists, sub_schedule.class_idx, sub_schedule.day,
+                            sub_schedule.start, sub_schedule.end)
+
+class BlockedTimes:
+    """
+    Blocked days and timings compiled once into a boolean array of the blocked minutes of every day.
+
+    Lessons are checked against it in bulk, with the same result as helpers.check_block_timings: a lesson is blocked
+    when it shares a minute with a block, or for lessons without duration, when it touches one.
+    """
+
+    def __init__(self, blocked_days: list, blocked_timings: dict):
+        self.blocked_days = np.zeros(8, dtype=bool)
+        self.blocked_days[list(blocked_days)] = True
+        # Two spare minutes, so that end times of 2400 and lookups of minute -1 stay within the unblocked padding
+        self.minutes = np.zeros((8, MINUTES_PER_DAY + 2), dtype=bool)
+        # Blocks that do not end after they start, which only block lessons spanning them as a whole
+        self.degenerate = []
+        for day, timings in blocked_timings.items():
+            for timing in timings:
+                block_start, block_end = map(parse_time, timing.split('-'))
+                if block_start < block_end:
+                    self.minutes[day, block_start:block_end] = True
+                else:
+                    self.degenerate.append((day, block_start, block_end))
+        # blocked_before[day, minute] is the number of blocked minutes of the day before minute
+        self.blocked_before = np.zeros((8, MINUTES_PER_DAY + 3), dtype=np.int32)
+        np.cumsum(self.minutes, axis=1, out=self.blocked_before[:, 1:])
+
+    def lessons_blocked(self, day, start, end):
+        """Boolean array of the lessons, given as arrays of day, start and end minutes, that are blocked."""
+        blocked = self.blocked_days[day]
+        has_duration = start < end
+        blocked |= has_duration & (self.blocked_before[day, end] > self.blocked_before[day, start])
+        # Lessons without duration are blocked when they start in a block or end right after one
+        blocked |= ~has_duration & (self.minutes[day, start] | self.minutes[day, end - 1])
+        for block_day, block_start, block_end in self.degenerate:
+            blocked |= (day == block_day) & (start <= block_start) & (end >= block_end)
+        return blocked
+
+    def filter(self, schedule: ScheduleData) -> ScheduleData:
+        """Schedule without the classes that have a blocked lesson."""
+        lesson_blocked = self.lessons_blocked(schedule.day, schedule.start, schedule.end)
+        class_blocked = np.bincount(schedule.class_idx, weights=lesson_blocked, minlength=len(schedule.class_nos)) > 0
+        return schedule.select(keep_classes=~class_blocked)